@@ -0,0 +1,76 @@
+"""
+Benchmark of the FITC inducing point emulator against the exact GP
+
+Fits both emulators to increasing numbers of training points of a smooth
+test function over the three input box used for the earthquake simulations,
+and prints fitting and prediction times and the root mean square difference
+between the two predicted means (relative to the standard deviation of the
+test function) and the mean ratio of the predicted variances.
+
+run : python benchmarks/bench_sparse_gp.py [max exact training points]
+"""
+import sys
+from os.path import abspath, dirname
+from time import perf_counter
+import numpy as np
+import mogp_emulator
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+from sparse_gp import FITCGaussianProcess
+
+
+def test_function(x):
+    # smooth function of the three inputs, similar in scale to the moment
+
+    return (50. + 0.5 * (x[:, 0] + 100.) + 80. * np.sin(10. * x[:, 1]) *
+            x[:, 2])
+
+
+def main(max_exact=2000):
+
+    ed = mogp_emulator.LatinHypercubeDesign(
+        [(-120., -80.), (0.1, 0.4), (0.9, 1.1)])
+    np.random.seed(42)
+    testing = ed.sample(10000)
+    f_test = test_function(testing)
+
+    print("{:>6s} {:>10s} {:>10s} {:>10s} {:>10s} {:>10s} {:>10s}".format(
+        "n", "exact fit", "exact pred", "fitc fit", "fitc pred",
+        "rel rmse", "var ratio"))
+
+    for n in [250, 500, 1000, 2000, 4000, 8000]:
+        inputs = ed.sample(n)
+        targets = test_function(inputs)
+
+        start = perf_counter()
+        fitc = FITCGaussianProcess(inputs, targets, n_inducing=200, seed=1)
+        fitc_fit = perf_counter() - start
+        start = perf_counter()
+        fitc_mean, fitc_unc, _ = fitc.predict(testing)
+        fitc_pred = perf_counter() - start
+
+        if n > max_exact:
+            print("{:6d} {:>10s} {:>10s} {:10.3f} {:10.3f} {:10.4f} {:>10s}".format(
+                n, "-", "-", fitc_fit, fitc_pred,
+                np.sqrt(np.mean((fitc_mean - f_test)**2)) / np.std(f_test),
+                "-"))
+            continue
+
+        start = perf_counter()
+        with np.errstate():
+            gp = mogp_emulator.fit_GP_MAP(
+                mogp_emulator.GaussianProcess(inputs, targets))
+        exact_fit = perf_counter() - start
+        start = perf_counter()
+        predictions = gp.predict(testing)
+        exact_pred = perf_counter() - start
+
+        print("{:6d} {:10.3f} {:10.3f} {:10.3f} {:10.3f} {:10.4f} {:10.3f}".format(
+            n, exact_fit, exact_pred, fitc_fit, fitc_pred,
+            np.sqrt(np.mean((fitc_mean - predictions[0])**2)) / np.std(f_test),
+            np.mean(fitc_unc) / np.mean(predictions[1])))
+
+
+if __name__ == "__main__":
+
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
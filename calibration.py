@@ -0,0 +1,119 @@
+import numpy as np
+from os.path import join
+from os import makedirs
+from designs import design_bounds
+from mogp_functions import load_emulator, load_design
+
+
+def log_posterior(gp, points, lower, upper, obs, obs_var=0.):
+    """
+    log posterior (up to a constant) of the simulation inputs at points given
+    observation obs with variance obs_var, for a uniform prior between lower
+    and upper
+
+    The emulator variance is added to the observation variance in the
+    Gaussian likelihood. All points inside the prior bounds are predicted
+    with a single call to gp.predict.
+    """
+
+    points = np.atleast_2d(points)
+    logp = np.full(len(points), -np.inf)
+
+    inside = np.all((points >= lower) & (points <= upper), axis=1)
+    if np.any(inside):
+        predictions = gp.predict(points[inside])
+        var = predictions[1] + obs_var
+        logp[inside] = -0.5 * ((predictions[0] - obs)**2 / var +
+                               np.log(2. * np.pi * var))
+
+    return logp
+
+
+def run_calibration(gp, lower, upper, obs, obs_var=0., n_walkers=64,
+                    n_steps=10000, thin=1, output_file="chain", a=2.,
+                    seed=None):
+    """
+    samples the posterior of the simulation inputs with an affine invariant
+    ensemble sampler (stretch move, Goodman and Weare, 2010)
+
+    The walkers are updated in two halves, each half moving relative to the
+    other, so the proposals of all walkers in a half are evaluated in one
+    gp.predict call. Every thin steps the walker positions and log posteriors
+    are written as float32 to the memory-mapped files output_file + "_chain.npy"
+    (shape (n_steps // thin, n_walkers, D)) and output_file + "_logp.npy".
+
+    Returns the acceptance fraction.
+    """
+
+    n_walkers = int(n_walkers)
+    n_steps = int(n_steps)
+    thin = int(thin)
+    D = len(lower)
+    assert n_walkers % 2 == 0 and n_walkers >= 2 * D, \
+        "n_walkers must be even and at least twice the number of inputs"
+
+    prng = np.random.RandomState(seed)
+
+    walkers = lower + (upper - lower) * prng.random_sample((n_walkers, D))
+    logp = log_posterior(gp, walkers, lower, upper, obs, obs_var)
+
+    chain = np.lib.format.open_memmap(output_file + "_chain.npy", mode="w+",
+                                      dtype=np.float32,
+                                      shape=(n_steps // thin, n_walkers, D))
+    logp_chain = np.lib.format.open_memmap(output_file + "_logp.npy",
+                                           mode="w+", dtype=np.float32,
+                                           shape=(n_steps // thin, n_walkers))
+
+    halves = (np.arange(n_walkers // 2), np.arange(n_walkers // 2, n_walkers))
+    n_accepted = 0
+
+    for step in range(n_steps):
+        for active, complement in (halves, halves[::-1]):
+            n = len(active)
+            z = ((a - 1.) * prng.random_sample(n) + 1.)**2 / a
+            partners = walkers[complement[prng.randint(len(complement), size=n)]]
+            proposal = partners + z[:, np.newaxis] * (walkers[active] - partners)
+
+            logp_proposal = log_posterior(gp, proposal, lower, upper, obs,
+                                          obs_var)
+            accept = (np.log(prng.random_sample(n)) <
+                      (D - 1.) * np.log(z) + logp_proposal - logp[active])
+
+            walkers[active[accept]] = proposal[accept]
+            logp[active[accept]] = logp_proposal[accept]
+            n_accepted += np.sum(accept)
+
+        if (step + 1) % thin == 0:
+            chain[(step + 1) // thin - 1] = walkers
+            logp_chain[(step + 1) // thin - 1] = logp
+
+    chain.flush()
+    logp_chain.flush()
+
+    return n_accepted / (n_steps * n_walkers)
+
+
+def run_mogp_calibration(known_value, obs_var, results_dir, n_walkers=64,
+                         n_steps=10000, thin=1, burn=0.5, seed=None):
+    """
+    calibrates the simulation inputs against known_value using the emulator
+    fitted by run_mogp_analysis, writing the chains to results/calibration_*
+    and printing posterior means and standard deviations after discarding the
+    first burn fraction of the chain
+    """
+
+    gp = load_emulator(join(results_dir, "results", "emulator.npz"))
+    lower, upper = design_bounds(load_design(results_dir))
+
+    makedirs(join(results_dir, "results"), exist_ok=True)
+    output_file = join(results_dir, "results", "calibration")
+    acceptance = run_calibration(gp, lower, upper, known_value, obs_var,
+                                 n_walkers, n_steps, thin, output_file,
+                                 seed=seed)
+
+    chain = np.load(output_file + "_chain.npy", mmap_mode='r')
+    samples = chain[int(burn * len(chain)):].reshape(-1, len(lower))
+
+    print("acceptance fraction : {:.3f}".format(acceptance))
+    print("posterior mean : {}".format(np.mean(samples, axis=0)))
+    print("posterior std : {}".format(np.std(samples, axis=0)))
@@ -0,0 +1,24 @@
+import sys
+import os
+import socket
+import subprocess
+import resource
+
+
+# Runs a command and writes the peak resident memory of the process it
+# starts (in kB, as reported by getrusage on Linux) to a file named from the
+# given prefix, the host name and the process ID. Launching each MPI rank
+# through this script measures the peak of every rank, including those
+# started on other nodes, which getrusage in the launching process misses.
+#
+# usage : python3 peak_rss.py <output prefix> <command> [arguments]
+
+if __name__ == "__main__":
+    returncode = subprocess.call(sys.argv[2:])
+
+    with open("{}_{}_{}.txt".format(sys.argv[1], socket.gethostname(),
+                                    os.getpid()), 'w') as f:
+        f.write("{}\n".format(
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss))
+
+    sys.exit(returncode)
@@ -0,0 +1,126 @@
+import numpy as np
+import json
+from os import walk
+from os.path import join
+from utils import problem_size
+
+
+def load_timings(results_dirs):
+    """
+    loads the timing records (timing.json) of all simulations found in the
+    given results directories
+    """
+
+    records = []
+    for results_dir in results_dirs:
+        for r, d, f in walk(results_dir):
+            if "timing.json" in f:
+                with open(join(r, "timing.json")) as input:
+                    records.extend(json.load(input))
+
+    return records
+
+
+def _cells(nt, nx, ny):
+    # grid points in both blocks times time steps
+
+    return float(nt) * nx * 2. * ny
+
+
+def fit_cost_model(records):
+    """
+    fits a cost model to timing records of past simulations
+
+    Wall time is modelled as log t = c0 + c1*log(work) + c2*log(n_proc), where
+    work is the number of grid point updates, and the peak memory of a single
+    process (MPI rank, as recorded in max_rss_mb) as
+    m0 + m1*(grid points / n_proc). Where the records do not vary work or
+    n_proc independently, their exponents cannot be fitted and ideal scaling
+    is assumed instead (c1 = 1, c2 = -1), and where they do not vary the grid
+    points per process, memory is taken as proportional to them (m0 = 0).
+    Returns the model as a dict, including the standard deviation of the log
+    wall time residuals and the list of assumed terms.
+    """
+
+    assert len(records) > 0, "no timing records found"
+
+    work = np.array([_cells(r["nt"], r["nx"], r["ny"]) for r in records])
+    points = np.array([r["nx"] * 2. * r["ny"] for r in records])
+    n_proc = np.array([r["n_proc"] for r in records], dtype=float)
+    wall_time = np.array([r["wall_time"] for r in records])
+    memory = np.array([r["max_rss_mb"] for r in records], dtype=float)
+
+    columns = [np.ones(len(records)), np.log(work), np.log(n_proc)]
+    time_coefficients = [0., 1., -1.]
+    fitted = [True, len(np.unique(work)) > 1, len(np.unique(n_proc)) > 1]
+    if (fitted[1] and fitted[2] and
+            np.linalg.matrix_rank(np.column_stack(columns)) < 3):
+        fitted[1] = fitted[2] = False
+
+    log_time = np.log(wall_time) - sum(c * s for c, s, f in
+                                       zip(columns, time_coefficients, fitted)
+                                       if not f)
+    A = np.column_stack([c for c, f in zip(columns, fitted) if f])
+    coefficients = np.linalg.lstsq(A, log_time, rcond=None)[0]
+    residuals = log_time - A.dot(coefficients)
+    for i, c in zip(np.flatnonzero(fitted), coefficients):
+        time_coefficients[i] = float(c)
+
+    assumed = [name for name, f in zip(("work", "n_proc"), fitted[1:])
+               if not f]
+
+    # simulations whose processes did not report their peak are left out
+
+    measured = np.isfinite(memory)
+    assert np.any(measured), "no peak memory recorded in timing records"
+    per_proc = points[measured] / n_proc[measured]
+    memory = memory[measured]
+
+    if len(np.unique(per_proc)) > 1:
+        B = np.column_stack((np.ones(len(memory)), per_proc))
+        memory_coefficients = list(np.linalg.lstsq(B, memory, rcond=None)[0])
+    else:
+        memory_coefficients = [0., float(np.mean(memory / per_proc))]
+        assumed.append("memory")
+
+    return {"time_coefficients": time_coefficients,
+            "time_log_std": float(np.std(residuals)),
+            "memory_coefficients": memory_coefficients,
+            "assumed_scaling": assumed,
+            "n_records": len(records)}
+
+
+def estimate_cost(model, sample_points=1, refine=1, nt=None, n_proc=4,
+                  n_std=2.):
+    """
+    estimates the cost of sample_points simulations at the given refine, nt
+    and n_proc using a model from fit_cost_model
+
+    Wall time is given at n_std standard deviations above the fitted value to
+    leave a safety margin. Returns a dict with the wall time and peak memory
+    (all processes) of one simulation and the core hours of all of them.
+    """
+
+    nt, nx, ny = problem_size(refine, nt)
+
+    c0, c1, c2 = model["time_coefficients"]
+    log_time = c0 + c1 * np.log(_cells(nt, nx, ny)) + c2 * np.log(n_proc)
+    wall_time = np.exp(log_time + n_std * model["time_log_std"])
+
+    m0, m1 = model["memory_coefficients"]
+    memory = n_proc * max(m0 + m1 * nx * 2. * ny / n_proc, 0.)
+
+    return {"wall_time": float(wall_time),
+            "memory_mb": float(memory),
+            "core_hours": float(sample_points * n_proc * wall_time / 3600.)}
+
+
+def format_wall_time(seconds):
+    """
+    formats a time in seconds as HH:MM:SS for scheduler requests
+    """
+
+    seconds = int(np.ceil(seconds))
+
+    return "{:02d}:{:02d}:{:02d}".format(seconds // 3600, seconds % 3600 // 60,
+                                         seconds % 60)
@@ -0,0 +1,227 @@
+import numpy as np
+from scipy.stats import qmc
+
+
+def transform_to_design(ed, unit_points):
+    """
+    maps points in the unit hypercube to the parameter space of the
+    experimental design ed, using the design's input distributions
+    """
+
+    unit_points = np.atleast_2d(unit_points)
+    assert unit_points.shape[1] == ed.get_n_parameters()
+
+    points = np.empty(unit_points.shape)
+    for i, dist in enumerate(ed.distributions):
+        points[:, i] = dist(unit_points[:, i])
+
+    return points
+
+
+def design_bounds(ed):
+    """
+    returns arrays of the lower and upper bounds of each input of ed (the
+    inputs must have bounded distributions, as for uniform bounds)
+    """
+
+    lower = np.array([dist(0.) for dist in ed.distributions])
+    upper = np.array([dist(1.) for dist in ed.distributions])
+
+    assert np.all(np.isfinite(lower)) and np.all(np.isfinite(upper)), \
+        "design inputs must have bounded distributions"
+
+    return lower, upper
+
+
+def to_unit_cube(ed, points):
+    """
+    maps points in the parameter space of ed to the unit hypercube, scaling
+    each input by its bounds
+    """
+
+    lower, upper = design_bounds(ed)
+
+    return (np.atleast_2d(points) - lower) / (upper - lower)
+
+
+def min_distances(points, others, chunk_size=128, exclude_self=False):
+    """
+    returns the distance from each of points to the nearest of others,
+    computed in chunks of others to limit memory use. With exclude_self,
+    zero distances (a point compared with itself) are ignored.
+    """
+
+    dist = np.full(len(points), np.inf)
+    for start in range(0, len(others), chunk_size):
+        chunk = others[start:start + chunk_size]
+        d = np.sqrt(np.sum((points[:, np.newaxis, :] -
+                            chunk[np.newaxis, :, :])**2, axis=-1))
+        if exclude_self:
+            d[d == 0.] = np.inf
+        dist = np.minimum(dist, np.min(d, axis=1))
+
+    return dist
+
+
+def maximin_augment(existing, candidates, n_new):
+    """
+    greedily selects n_new of candidates, each time taking the candidate
+    farthest from the existing and already selected points (all in the unit
+    hypercube), so that the augmented design stays space filling
+
+    The distance from each candidate to its nearest selected point is updated
+    with one vectorized distance computation per selected point.
+    Returns the indices of the selected candidates.
+    """
+
+    assert n_new <= len(candidates), "not enough candidate points"
+
+    dist = min_distances(candidates, existing)
+    selected = []
+    for i in range(int(n_new)):
+        best = int(np.argmax(dist))
+        selected.append(best)
+        dist = np.minimum(dist, np.sqrt(np.sum((candidates -
+                                                candidates[best])**2, axis=1)))
+
+    return np.array(selected, dtype=int)
+
+
+def qmc_sampler(ed, method="sobol", seed=None):
+    """
+    returns a scrambled low discrepancy sequence generator ('sobol' or
+    'halton') for the parameter space of ed. Draw points in the unit
+    hypercube from it with its random method and map them with
+    transform_to_design.
+    """
+
+    assert method in ("sobol", "halton"), "method must be 'sobol' or 'halton'"
+
+    if method == "sobol":
+        return qmc.Sobol(ed.get_n_parameters(), scramble=True, seed=seed)
+    else:
+        return qmc.Halton(ed.get_n_parameters(), scramble=True, seed=seed)
+
+
+def qmc_sample(ed, n_samples, method="sobol", seed=None):
+    """
+    draws n_samples points from a scrambled low discrepancy sequence over the
+    parameter space of ed (Sobol sequences are best balanced for n_samples a
+    power of 2)
+    """
+
+    sampler = qmc_sampler(ed, method, seed)
+
+    return transform_to_design(ed, sampler.random(int(n_samples)))
+
+
+def _phi_p_rows(columns, rows, p):
+    # sum of d**-p from each of rows to all other points, for points stored
+    # by column (shape (n_parameters, n_samples)) and p an even integer,
+    # raising to the power by repeated squaring rather than with np.power
+
+    d2 = np.zeros((len(rows), columns.shape[1]))
+    for column in columns:
+        d2 += (column[np.newaxis, :] - column[rows][:, np.newaxis])**2
+    d2[np.arange(len(rows)), rows] = np.inf
+
+    r = 1. / d2
+    result = np.ones(d2.shape)
+    n = int(p) // 2
+    while n > 0:
+        if n % 2 == 1:
+            result *= r
+        r = r * r
+        n //= 2
+
+    return np.sum(result, axis=1)
+
+
+def maximin_lhs(n_samples, n_parameters, n_iter=None, p=16, seed=None):
+    """
+    generates a Latin hypercube design in the unit hypercube optimized for
+    space filling by the Morris and Mitchell (1995) phi_p criterion (p an
+    even integer), which approaches the maximin criterion for large p
+
+    Starting from a random Latin hypercube, n_iter (default 20*n_samples)
+    random swaps of one coordinate between two points are tried, and kept if
+    they reduce phi_p. A swap only changes the distances from the two points
+    involved, so each trial is one vectorized O(n_samples) update and the
+    full distance matrix is never formed.
+    """
+
+    assert p > 0 and p % 2 == 0, "p must be a positive even integer"
+
+    n_samples = int(n_samples)
+    if n_iter is None:
+        n_iter = 20 * n_samples
+
+    prng = np.random.RandomState(seed)
+    columns = ((np.argsort(prng.random_sample((n_parameters, n_samples)),
+                           axis=1) + prng.random_sample(
+                               (n_parameters, n_samples))) / n_samples)
+
+    if n_samples < 3:
+        return columns.T
+
+    for it in range(int(n_iter)):
+        i = prng.randint(n_samples)
+        rows = np.array([i, (i + prng.randint(1, n_samples)) % n_samples])
+        k = prng.randint(n_parameters)
+
+        # the distance between the two swapped points does not change, so
+        # comparing the sums over their rows compares phi_p before and after
+
+        old = np.sum(_phi_p_rows(columns, rows, p))
+        columns[k, rows] = columns[k, rows[::-1]]
+        new = np.sum(_phi_p_rows(columns, rows, p))
+        if new >= old:
+            columns[k, rows] = columns[k, rows[::-1]]
+
+    return columns.T
+
+
+def design_quality(unit_points, p=16):
+    """
+    returns space filling metrics of a design in the unit hypercube: the
+    minimum distance between points, the phi_p criterion and the centered L2
+    discrepancy
+    """
+
+    unit_points = np.atleast_2d(unit_points)
+    dist = min_distances(unit_points, unit_points, exclude_self=True)
+
+    columns = np.ascontiguousarray(unit_points.T)
+    phi_p = 0.
+    for start in range(0, len(unit_points), 128):
+        rows = np.arange(start, min(start + 128, len(unit_points)))
+        phi_p += np.sum(_phi_p_rows(columns, rows, p))
+
+    return {"min_distance": float(np.min(dist)),
+            "phi_p": float((phi_p / 2.)**(1. / p)),
+            "discrepancy": float(qmc.discrepancy(np.clip(unit_points, 0., 1.),
+                                                 method="CD"))}
+
+
+def generate_design(ed, n_samples, design="lhs", seed=None):
+    """
+    generates n_samples points over the parameter space of ed using design:
+    'lhs' (random Latin hypercube from ed), 'maximin' (optimized Latin
+    hypercube), or 'sobol' or 'halton' (scrambled low discrepancy sequences)
+
+    Returns the points and the space filling metrics of design_quality
+    """
+
+    assert design in ("lhs", "maximin", "sobol", "halton"), \
+        "design must be 'lhs', 'maximin', 'sobol' or 'halton'"
+
+    if design == "lhs":
+        points = ed.sample(n_samples)
+    elif design == "maximin":
+        points = transform_to_design(ed, maximin_lhs(n_samples,
+                                                     ed.get_n_parameters(),
+                                                     seed=seed))
+    else:
+        points = qmc_sample(ed, n_samples, design, seed)
+
+    return points, design_quality(to_unit_cube(ed, points))
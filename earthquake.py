@@ -1,16 +1,21 @@
-from os.path import join
+from os.path import join, splitext, relpath, dirname, exists, islink, abspath
+from os import listdir, makedirs, remove, replace, symlink
+import hashlib
+import sys
+from glob import glob
 import fdfault
-import fdfault.analysis
 import numpy as np
-from utils import generate_profile, generate_normals_2d, rotate_xy2nt_2d
+from utils import LX, LY, MUS, problem_size, fault_geometry, fault_tractions
+from fdfault_io import MappedOutput
 import subprocess
-from scipy.integrate import simps
+from scipy.integrate import simpson
 
 
 def create_problem(arg, name="rough_example",
-                   outname="ufault",
+                   outname="ufault", stressname="sfault",
                    refine=1,
-                   output_dir="", vy_snapshot=False):
+                   output_dir="", vy_snapshot=False, shared_dir=None,
+                   nt=None, snapshots=()):
     """
     Create demo problem
 
@@ -22,7 +27,16 @@ def create_problem(arg, name="rough_example",
     Optional:
     name = problem name (string)
     outname = name of output file (string)
+    stressname = name of output file for initial and final shear stress on the
+                 fault (string, or None to skip this output)
     refine = simulation refinement(default is 1, which should be fine for this)
+    shared_dir = directory holding input files shared across problems (see
+                 share_inputs). If None, every problem keeps its own copies.
+    nt = number of time steps (default is 800*refine+1, use fewer for short
+         probe runs)
+    vy_snapshot = add a full domain snapshot of vy at 3/4 of the run (bool)
+    snapshots = list of dicts of keyword arguments of snapshot_output, each
+                adding a snapshot output unit (strides, time window and region)
 
     Outputs:
     None
@@ -45,11 +59,9 @@ def create_problem(arg, name="rough_example",
 
     # set problem info
 
-    nt = 800 * refine + 1
-    nx = 400 * refine + 1
-    ny = 150 * refine + 1
-    lx = 32.
-    ly = 12.
+    nt, nx, ny = problem_size(refine, nt)
+    lx = LX
+    ly = LY
 
     p.set_nt(nt)
     p.set_cfl(0.3)
@@ -75,22 +87,17 @@ def create_problem(arg, name="rough_example",
     sxx = sxtosy * syy
     sxy = -syy * ston
 
-    x = np.linspace(0., lx, nx)
-    y = ly * np.ones(nx) + generate_profile(nx, lx, 1.e-2, 20, 1., 18749)
+    x, y, norm_x, norm_y = fault_geometry(refine)
 
     surf = fdfault.curve(nx, 'y', x, y)
 
     # set initial fields
 
-    norm_x, norm_y = generate_normals_2d(x, y, 'y')
-    sn = np.zeros(nx)
-    st = np.zeros(nx)
-
-    for i in range(nx):
-        sn[i], st[i] = rotate_xy2nt_2d(
-            sxx, sxy, syy, (norm_x[i], norm_y[i]), 'y')
+    sn, st = fault_tractions(arg, refine)
+    sn = sn[0]
+    st = st[0]
 
-    assert np.all(st + 0.7 * sn < 0.), "shear stress is too high"
+    assert np.all(st + MUS * sn < 0.), "shear stress is too high"
 
     p.set_block_surf((0, 0, 0), 3, surf)
     p.set_block_surf((0, 1, 0), 2, surf)
@@ -103,7 +110,7 @@ def create_problem(arg, name="rough_example",
 
     # set slip weakening parameters
 
-    p.add_pert(fdfault.swparam('constant', dc=0.8, mus=0.7, mud=0.2), 0)
+    p.add_pert(fdfault.swparam('constant', dc=0.8, mus=MUS, mud=0.2), 0)
     p.add_pert(fdfault.swparam('boxcar', x0=2., dx=2., mus=10000.), 0)
     p.add_pert(fdfault.swparam('boxcar', x0=30., dx=2., mus=10000.), 0)
 
@@ -111,7 +118,7 @@ def create_problem(arg, name="rough_example",
 
     nuc_pert = np.zeros((nx, 1))
     idx = (np.abs(x - lx / 2.) < 2.)
-    nuc_pert[idx, 0] = (-0.7 * sn[idx] - st[idx]) + 0.1
+    nuc_pert[idx, 0] = (-MUS * sn[idx] - st[idx]) + 0.1
 
     p.set_loadfile(0, fdfault.loadfile(
         nx, 1, np.zeros((nx, 1)), nuc_pert, np.zeros((nx, 1))))
@@ -119,25 +126,120 @@ def create_problem(arg, name="rough_example",
     # add output unit
     p.set_datadir(join(output_dir, "data"))
     if vy_snapshot:
-        p.add_output(fdfault.output("vybody", "vy", (nt - 1)*3//4, (nt - 1)*3//4, 1,
-                                    0, nx - 1, 1, 0, 2*ny - 1, 1, 0, 0, 1))
+        p.add_output(snapshot_output(nt, nx, ny))
+    for snapshot in snapshots:
+        p.add_output(snapshot_output(nt, nx, ny, **snapshot))
     p.add_output(fdfault.output(outname, 'U', nt, nt, 1,
                                 0, nx - 1, 1, ny, ny, 1, 0, 0, 1))
+    if stressname is not None:
+        p.add_output(fdfault.output(stressname, 'S', 0, nt, nt,
+                                    0, nx - 1, 1, ny, ny, 1, 0, 0, 1))
 
     p.write_input(directory=join(output_dir, "problems"))
 
+    if shared_dir is not None:
+        share_inputs(name, join(output_dir, "problems"), shared_dir)
+
+
+def snapshot_output(nt, nx, ny, name="vybody", field="vy", tm=None, tp=None,
+                    ts=1, xm=0, xp=None, xs=1, ym=0, yp=None, ys=1,
+                    float32=False):
+    """
+    returns an fdfault output unit for a snapshot of a body field
+
+    tm, tp, ts are the first and last time step and the time stride (default
+    is the single step at 3/4 of the run). xm, xp, xs and ym, yp, ys are the
+    first and last grid index and stride of the region of interest in each
+    direction (default is the whole domain of both blocks, y indices running
+    from 0 to 2*ny-1). float32 is used by run_fdfault_simulation, which then
+    converts the output to single precision after the run (see
+    fdfault_io.convert_to_float32).
+    """
+
+    if tm is None:
+        tm = (nt - 1) * 3 // 4
+    if tp is None:
+        tp = tm
+    if xp is None:
+        xp = nx - 1
+    if yp is None:
+        yp = 2 * ny - 1
+
+    assert 0 <= tm <= tp <= nt, "time window out of range"
+    assert 0 <= xm <= xp < nx and 0 <= ym <= yp < 2 * ny, \
+        "region of interest out of range"
+
+    return fdfault.output(name, field, tm, tp, ts,
+                          xm, xp, xs, ym, yp, ys, 0, 0, 1)
+
+
+# input files that depend on the stresses and so differ between problems
+
+PER_PROBLEM_SUFFIXES = (".in", ".load")
+
+
+def share_inputs(name, problem_dir, shared_dir):
+    """
+    moves the invariant input files written for problem name (fault surfaces
+    and anything else that is not a .in or load file) into shared_dir under
+    the hash of their contents, and replaces them with relative symlinks
+
+    Identical files written by different ensemble members are only stored
+    once. Moves into shared_dir are atomic, so concurrent jobs writing the
+    same file are safe.
+    """
+
+    makedirs(shared_dir, exist_ok=True)
+
+    for filename in sorted(listdir(problem_dir)):
+        path = join(problem_dir, filename)
+        ext = splitext(filename)[1]
+        if (not filename.startswith(name + "_") or islink(path) or
+                ext in PER_PROBLEM_SUFFIXES):
+            continue
+
+        with open(path, 'rb') as f:
+            digest = hashlib.sha1(f.read()).hexdigest()
+        target = join(shared_dir, digest + ext)
+
+        if exists(target):
+            remove(path)
+        else:
+            replace(path, target)
+        symlink(relpath(target, dirname(path)), path)
+
 
 def run_simulation(name="rough_example",
                    n_proc=1,
                    mpi_exec=None,
                    fdfault_exec=None,
-                   output_dir=""):
+                   output_dir="",
+                   measure_memory=False):
     """
     launches problem with specified number of processes
+
+    With measure_memory, each process is launched through peak_rss.py, and
+    the largest peak resident memory of any one process (in MB) is returned.
     """
-    subprocess.run([mpi_exec, "-n", str(int(n_proc)),
-                join(fdfault_exec, "fdfault"), output_dir + "/problems/" + name + ".in"],
-               cwd=fdfault_exec)
+    command = [join(fdfault_exec, "fdfault"),
+               output_dir + "/problems/" + name + ".in"]
+
+    if measure_memory:
+        prefix = join(abspath(output_dir), "data", name + "_rss")
+        command = [sys.executable,
+                   join(dirname(abspath(__file__)), "peak_rss.py"),
+                   prefix] + command
+
+    subprocess.run([mpi_exec, "-n", str(int(n_proc))] + command,
+                   cwd=fdfault_exec)
+
+    if measure_memory:
+        peaks = []
+        for path in glob(prefix + "_*.txt"):
+            with open(path) as f:
+                peaks.append(float(f.read()) / 1024.)
+            remove(path)
+        return max(peaks) if peaks else None
 
 
 def compute_moment(name="rough_example",
@@ -145,10 +247,100 @@ def compute_moment(name="rough_example",
                    results_dir=None):
     """
     computes seismic moment for a given problem
+
+    only the final time slip is read from the memory-mapped output
     """
 
     datadir = join(results_dir, "data")
-    U = fdfault.analysis.output(name, outname, datadir)
-    U.load()
 
-    return simps(U.U, U.x)
+    return extract_moment({"ufault": MappedOutput(name, outname, datadir)})
+
+
+# quantities of interest that can be extracted from a simulation, by name.
+# Each entry holds the extractor function and the output units it reads;
+# extractors are called with a dict of MappedOutput objects for those units.
+
+EXTRACTORS = {}
+
+# slip (same units as the U output) above which the fault counts as ruptured
+
+SLIP_THRESHOLD = 1.e-3
+
+
+def register_extractor(name, outnames=("ufault",)):
+    """
+    decorator adding a function to EXTRACTORS under name, reading the output
+    units outnames
+    """
+
+    def register(function):
+        EXTRACTORS[name] = (function, tuple(outnames))
+        return function
+
+    return register
+
+
+@register_extractor("moment")
+def extract_moment(outputs):
+    """
+    seismic moment (integral of final slip along the fault)
+    """
+    U = outputs["ufault"]
+    return simpson(U.get_slice(-1), x=U.get_coord('x'))
+
+
+@register_extractor("peak_slip")
+def extract_peak_slip(outputs):
+    """
+    maximum final slip on the fault
+    """
+    return np.max(outputs["ufault"].get_slice(-1))
+
+
+@register_extractor("rupture_length")
+def extract_rupture_length(outputs):
+    """
+    length of fault (along x) with final slip above SLIP_THRESHOLD, summing
+    the grid spacing at the slipped points (integrating the 0/1 indicator
+    with Simpson's rule weights the points unevenly)
+    """
+    U = outputs["ufault"]
+    x = U.get_coord('x')
+    return np.sum(np.gradient(x)[U.get_slice(-1) > SLIP_THRESHOLD])
+
+
+@register_extractor("stress_drop", ("ufault", "sfault"))
+def extract_stress_drop(outputs):
+    """
+    mean drop in shear stress over the part of the fault with final slip above
+    SLIP_THRESHOLD
+    """
+    slipped = outputs["ufault"].get_slice(-1) > SLIP_THRESHOLD
+    S = outputs["sfault"]
+    if not np.any(slipped):
+        return 0.
+    return np.mean(S.get_slice(0)[slipped] - S.get_slice(-1)[slipped])
+
+
+def extract_quantities(name="rough_example",
+                       quantities=("moment",),
+                       results_dir=None):
+    """
+    computes the quantities of interest named in quantities (keys of
+    EXTRACTORS) for a given problem, opening each output unit needed once
+
+    Returns an array holding one value per quantity
+    """
+
+    for quantity in quantities:
+        assert quantity in EXTRACTORS, "unknown quantity " + quantity
+
+    datadir = join(results_dir, "data")
+    outputs = {}
+    for quantity in quantities:
+        for outname in EXTRACTORS[quantity][1]:
+            if outname not in outputs:
+                outputs[outname] = MappedOutput(name, outname, datadir)
+
+    return np.array([EXTRACTORS[quantity][0](outputs)
+                     for quantity in quantities])
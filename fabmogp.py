@@ -11,17 +11,95 @@ except ImportError:
     from base.fab import *
 
 from pprint import pprint
+import os
+import json
+import numpy as np
 
 # Add local script, blackbox and template path.
 add_local_paths("fabmogp")
 
+# process counts per simulation tuned by mogp_tune_n_proc, by machine and refine
+tuned_n_proc_file = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 "tuned_n_proc.json")
+
+
+def get_n_proc(n_proc=0, refine=1):
+    """
+    returns n_proc if nonzero, else the tuned process count per simulation
+    for the current machine and refine level, else the default of 4
+    """
+    if int(n_proc) > 0:
+        return int(n_proc)
+    if os.path.exists(tuned_n_proc_file):
+        with open(tuned_n_proc_file) as f:
+            tuned = json.load(f)
+        return tuned.get(env.machine_name, {}).get(str(refine), 4)
+    return 4
+
+
+def parse_bounds(bounds):
+    """
+    returns the parameter box given as lower:upper ranges separated by ';'
+    ("-120:-80;0.1:0.4;0.9:1.1"), or None (the default box) if empty
+    """
+    if not bounds:
+        return None
+    return [tuple(float(v) for v in r.split(":")) for r in bounds.split(";")]
+
+
+def estimate_resources(timing_dirs, sample_points, sims_per_job, n_proc,
+                       refine=1):
+    """
+    fits the cost model to the timings of past runs in timing_dirs (results
+    directories separated by ';'), prints the estimated cost of sample_points
+    simulations, and sets the scheduler wall time, memory and cores of jobs
+    running sims_per_job simulations each
+    """
+    from .cost_model import (load_timings, fit_cost_model, estimate_cost,
+                             format_wall_time)
+
+    model = fit_cost_model(load_timings(
+        [os.path.join(env.local_results, d) for d in timing_dirs.split(";")]))
+    cost = estimate_cost(model, int(sample_points), int(refine),
+                         n_proc=n_proc)
+
+    print("cost model from {} runs".format(model["n_records"]))
+    if model["assumed_scaling"]:
+        print("ideal scaling assumed for : {} (not varied in timings)".format(
+            ", ".join(model["assumed_scaling"])))
+    print("wall time per simulation : {}".format(
+        format_wall_time(cost["wall_time"])))
+    print("peak memory per simulation : {:.0f} MB".format(cost["memory_mb"]))
+    print("total core hours : {:.2f}".format(cost["core_hours"]))
+
+    env.job_wall_time = format_wall_time(sims_per_job * cost["wall_time"])
+    env.memory = "{:d}M".format(int(np.ceil(cost["memory_mb"])))
+    env.cores = n_proc
+
+    return cost
+
 
 @task
-def mogp(config, seed=0, **args):
+def mogp(config, seed=0, screen='resample', n_proc=0, timing_dirs='',
+         design='lhs', bounds='', **args):
     """
     Submit a single mogp job to the remote queue.
     The job results will be stored with a name pattern as defined in the environment,
     run : fabsim localhost mogp:demo
+
+    Design points exceeding the fault strength are replaced before submission,
+    or only reported with screen=flag (screen=none skips the check).
+    Each simulation uses n_proc MPI processes, by default the value tuned for
+    this machine with mogp_tune_n_proc (or 4 if not tuned), and the job
+    requests n_proc cores.
+    With timing_dirs (previous results directories separated by ';'), the
+    wall time, memory and cores requested are set from the cost model.
+    design selects the design generator : lhs (random Latin hypercube),
+    maximin (space filling optimized Latin hypercube), sobol or halton.
+    bounds sets the parameter box as lower:upper ranges separated by ';' :
+        fabsim localhost mogp:demo,"bounds=-110:-90;0.2:0.3;0.95:1.05"
+    The fault strength screen is skipped for boxes that do not have three
+    inputs.
     """
     update_environment(args)
     with_config(config)
@@ -29,12 +107,21 @@ def mogp(config, seed=0, **args):
     if (hasattr(env, 'sample_points') == False):
         env.sample_points = 1
     env.seed = int(seed)
+    env.share_inputs = 0
+    env.n_proc = get_n_proc(n_proc)
+    env.cores = env.n_proc
+    if timing_dirs:
+        estimate_resources(timing_dirs, env.sample_points,
+                           int(env.sample_points), env.n_proc)
 
     from .init_config import mogp_configuration_initialization
     mogp_configuration_initialization(env.sample_points,
                                       env.job_config_path_local,
                                       False,
-                                      env.seed)
+                                      env.seed,
+                                      screen,
+                                      design=design,
+                                      bounds=parse_bounds(bounds))
 
     execute(put_configs, config)
 
@@ -42,11 +129,29 @@ def mogp(config, seed=0, **args):
 
 
 @task
-def mogp_ensemble(config, sample_points=1, seed=0, script='mogp', **args):
+def mogp_ensemble(config, sample_points=1, seed=0, script='mogp',
+                  share_inputs=1, screen='resample', n_proc=0, timing_dirs='',
+                  augment=0, design='lhs', bounds='', **args):
     """
     Submits an ensemble of mogp jobs.
     One job is run for each file in <config_file_directory>/SWEEP.
     run : fabsim localhost mogp_ensemble:demo,sample_points=5
+
+    Input files that are identical across members (the fault surface) are
+    stored once in RUNS/shared_inputs and symlinked, unless share_inputs=0.
+    The design is screened as for mogp before any SWEEP folder is written,
+    n_proc, design, bounds and, with timing_dirs, the resources requested for
+    each job are set as for mogp.
+
+    With augment=1, sample_points new points are added to the previous
+    ensemble design (chosen to be far from the existing points) and only they
+    are run, in folders numbered after the existing ones. The previous design
+    is read from design.npy and the SWEEP folders before they are cleaned, or
+    with augment=<results_dir> (several separated by ';') from the fetched
+    results of the ensemble. Analyse the new points together with the earlier
+    results by passing all results directories to mogp_analysis :
+        fabsim localhost mogp_ensemble:demo,sample_points=50,augment=1
+        fabsim localhost mogp_ensemble:demo,sample_points=50,augment=demo_localhost_16
     """
     update_environment(args)
     with_config(config)
@@ -55,44 +160,260 @@ def mogp_ensemble(config, sample_points=1, seed=0, script='mogp', **args):
     env.script = script
     env.sample_points = sample_points
     env.seed = int(seed)
+    env.share_inputs = int(share_inputs)
+    env.n_proc = get_n_proc(n_proc)
+    env.cores = env.n_proc
     env.mood = "run_simulation"
+    if timing_dirs:
+        estimate_resources(timing_dirs, sample_points, 1, env.n_proc)
+
+    # read the design to augment before the SWEEP folders are removed
+    from .init_config import (mogp_configuration_initialization,
+                              load_ensemble_design)
+    augment = str(augment)
+    existing = None
+    if augment == "1":
+        existing = load_ensemble_design(
+            [sweep_dir], os.path.join(env.job_config_path_local, "design.npy"))
+    elif augment != "0":
+        existing = load_ensemble_design(
+            [os.path.join(env.local_results, d) for d in augment.split(";")])
 
     # clean SWEEP directory
     local("rm -rf %s/*" % (sweep_dir))
-    # generate a separated SWEEP folder for each sample_point
-    for i in range(1, int(sample_points) + 1):
-        folder_name = "sample_point_" + str(i)
-        local("mkdir -p %s/%s" % (sweep_dir, folder_name))
 
-    from .init_config import mogp_configuration_initialization
+    # a separate SWEEP folder is generated for each sample_point
     mogp_configuration_initialization(env.sample_points,
                                       env.job_config_path_local,
-                                      True, env.seed)
+                                      True, env.seed, screen,
+                                      existing is not None, design,
+                                      parse_bounds(bounds), existing)
 
     run_ensemble(config, sweep_dir, **args)
 
 
+@task
+def mogp_tune_n_proc(config, n_procs='1;2;4;8', refine=1, probe_nt=101,
+                     ensemble_cores=0, **args):
+    """
+    Submits a job running short probe simulations with each process count in
+    n_procs (separated by ';') to fit a strong scaling curve for this machine.
+    ensemble_cores is the number of cores shared by ensemble members (default
+    is the largest process count probed). The job requests as many cores as
+    the largest process count probed.
+    run : fabsim localhost mogp_tune_n_proc:demo,"n_procs=1;2;4;8;16",ensemble_cores=16
+
+    Once the job is done and fetched, store the result with mogp_store_n_proc.
+    """
+    update_environment(args)
+    with_config(config)
+    n_procs = [int(n) for n in n_procs.split(";")]
+    env.tune_n_procs = ",".join(str(n) for n in n_procs)
+    env.tune_refine = int(refine)
+    env.probe_nt = int(probe_nt)
+    env.tune_cores = int(ensemble_cores)
+    env.cores = max(n_procs)
+
+    execute(put_configs, config)
+
+    job(dict(script='mogp_tune'), args)
+
+
+@task
+def mogp_store_n_proc(config, results_dir):
+    """
+    run : fabsim localhost mogp_store_n_proc:demo,demo_localhost_17
+
+    Stores the process count per simulation that maximizes ensemble throughput,
+    found by a fetched mogp_tune_n_proc job, for the current machine. mogp and
+    mogp_ensemble then use it by default.
+    """
+    with_config(config)
+
+    with open(os.path.join(env.local_results, results_dir,
+                           "n_proc_tuning.json")) as f:
+        tuning = json.load(f)
+
+    tuned = {}
+    if os.path.exists(tuned_n_proc_file):
+        with open(tuned_n_proc_file) as f:
+            tuned = json.load(f)
+    tuned.setdefault(env.machine_name, {})[str(tuning["refine"])] = \
+        tuning["best_n_proc"]
+    with open(tuned_n_proc_file, 'w') as f:
+        json.dump(tuned, f, indent=2)
+
+    print("n_proc for {} (refine={}) set to {}".format(
+        env.machine_name, tuning["refine"], tuning["best_n_proc"]))
+
+
+@task
+def mogp_cost(config, timing_dirs, sample_points=1, refine=1, n_proc=0):
+    """
+    run : fabsim localhost mogp_cost:demo,"demo_localhost_16;demo_localhost_17",sample_points=200
+
+    Estimates the wall time, peak memory and core hours of sample_points
+    simulations from the timings recorded by previous runs in timing_dirs
+    (results directories separated by ';').
+    """
+    with_config(config)
+
+    estimate_resources(timing_dirs, sample_points, 1,
+                       get_n_proc(n_proc, int(refine)), int(refine))
+
+
 @task
 def mogp_analysis(config,
                   results_dir,
                   analysis_points=10000,
                   known_value=58.,
-                  threshold=3.):
+                  threshold=3.,
+                  n_tries=15,
+                  fit_processes=1,
+                  sampler='lhs',
+                  nroy_tolerance=0.,
+                  quantity='moment',
+                  quantities='',
+                  loo_min_coverage=0.,
+                  obs_var=0.,
+                  emulator='exact',
+                  n_inducing=200):
     """
     run : fabsim localhost mogp_analysis:demo,demo_localhost_16
 
+    Several results directories separated by ';' (such as an ensemble and
+    its augmentations) are analysed together, with the results saved in the
+    first :
+        fabsim localhost mogp_analysis:demo,"demo_localhost_16;demo_localhost_17"
+
+    fit_processes=N runs the n_tries hyperparameter fitting restarts in a pool
+    of N processes (0 uses all cores) :
+        fabsim localhost mogp_analysis:demo,demo_localhost_16,fit_processes=0
+
+    sampler=sobol or sampler=halton draws the query points from a scrambled
+    low discrepancy sequence (sobol rounds the number of points up to a power
+    of 2). With nroy_tolerance > 0, query points are added
+    in batches of analysis_points until the 95% confidence interval of the
+    NROY volume fraction is narrower than +/- nroy_tolerance :
+        fabsim localhost mogp_analysis:demo,demo_localhost_16,nroy_tolerance=0.005
+
+    The emulator is fitted to quantity (moment, peak_slip, rupture_length or
+    stress_drop). Any other quantities (separated by ';') are extracted in
+    the same pass over the outputs and saved to results/quantities.txt :
+        fabsim localhost mogp_analysis:demo,demo_localhost_16,"quantities=peak_slip;rupture_length"
+
+    With loo_min_coverage > 0 (e.g. 0.8), leave-one-out diagnostics of the
+    emulator are saved to results/loo_diagnostics.txt, and the analysis stops
+    if the coverage of the 2 standard deviation intervals is below it.
+
+    known_value, obs_var and threshold can be lists separated by ';'. The
+    predictions are then reused for every combination, and the NROY fractions
+    and masks are saved to results/nroy_sweep.txt and results/nroy_masks.npz :
+        fabsim localhost mogp_analysis:demo,demo_localhost_16,"known_value=55;58;61","threshold=2;3"
+
+    For large ensembles, emulator=fitc fits an inducing point approximation
+    with n_inducing points instead of the exact GP (see sparse_gp.py for its
+    accuracy). It cannot be validated with loo_min_coverage, and it is not
+    saved, so mogp_serve, mogp_calibration and mogp_sensitivity need an
+    exact GP analysis of the same results :
+        fabsim localhost mogp_analysis:demo,demo_localhost_16,emulator=fitc,n_inducing=300
+
     make sure that you already fetch the results:
                         fab localhost fetch_results
     """
     with_config(config)
     env.mood = "run_simulation"
-    env.analysis_points = analysis_points
-    env.known_value = known_value
-    env.threshold = threshold
+    env.analysis_points = int(analysis_points)
+    env.known_value = [float(v) for v in str(known_value).split(";")]
+    env.threshold = [float(v) for v in str(threshold).split(";")]
+    env.obs_var = [float(v) for v in str(obs_var).split(";")]
 
     from .mogp_functions import run_mogp_analysis
     run_mogp_analysis(env.analysis_points,
                       env.known_value,
                       env.threshold,
-                      "{}/{}".format(env.local_results, results_dir)
+                      ["{}/{}".format(env.local_results, d)
+                       for d in results_dir.split(";")],
+                      int(n_tries),
+                      int(fit_processes),
+                      sampler,
+                      float(nroy_tolerance),
+                      quantity,
+                      [q for q in quantities.split(";") if q],
+                      float(loo_min_coverage),
+                      env.obs_var,
+                      emulator,
+                      int(n_inducing)
                       )
+
+
+@task
+def mogp_serve(config, results_dir, port=8765, max_wait=0.002):
+    """
+    run : fabsim localhost mogp_serve:demo,demo_localhost_16,port=8765
+
+    Serves predictions from the emulator fitted by mogp_analysis on
+    http://127.0.0.1:port. Concurrent requests arriving within max_wait seconds
+    are predicted together; GET /stats returns latency and throughput counters.
+    """
+    with_config(config)
+
+    from .mogp_server import serve_emulator
+    serve_emulator("{}/{}/results/emulator.npz".format(env.local_results,
+                                                       results_dir),
+                   int(port), max_wait=float(max_wait))
+
+
+@task
+def mogp_calibration(config,
+                     results_dir,
+                     known_value=58.,
+                     obs_var=0.,
+                     n_walkers=64,
+                     n_steps=10000,
+                     thin=1,
+                     seed=0):
+    """
+    run : fabsim localhost mogp_calibration:demo,demo_localhost_16,n_steps=20000
+
+    Samples the posterior of the simulation inputs given known_value (with
+    variance obs_var) using the emulator fitted by mogp_analysis. Chains are
+    written to results/calibration_chain.npy and results/calibration_logp.npy.
+    """
+    with_config(config)
+
+    from .calibration import run_mogp_calibration
+    run_mogp_calibration(float(known_value),
+                         float(obs_var),
+                         "{}/{}".format(env.local_results, results_dir),
+                         int(n_walkers),
+                         int(n_steps),
+                         int(thin),
+                         seed=int(seed) or None)
+
+
+@task
+def mogp_sensitivity(config,
+                     results_dir,
+                     n_samples=2**20,
+                     chunk_size=2**14,
+                     processes=1,
+                     n_bootstrap=1000,
+                     seed=0):
+    """
+    run : fabsim localhost mogp_sensitivity:demo,demo_localhost_16,processes=0
+
+    Computes first order and total Sobol indices of the emulator fitted by
+    mogp_analysis from n_samples Saltelli sample pairs, predicted in chunks of
+    chunk_size (in a pool of processes, 0 uses all cores), with bootstrap
+    confidence intervals. Results are saved to results/sobol_indices.txt.
+    """
+    with_config(config)
+
+    from .sensitivity import run_mogp_sensitivity
+    run_mogp_sensitivity("{}/{}".format(env.local_results, results_dir),
+                         int(n_samples),
+                         int(chunk_size),
+                         int(processes) or None,
+                         int(n_bootstrap),
+                         int(seed) or None)
@@ -0,0 +1,160 @@
+from os.path import join, exists
+from os import remove, replace as os_replace
+import numpy as np
+
+
+class MappedOutput(object):
+    """
+    Memory-mapped reader for fdfault output units
+
+    Reads the same files as fdfault.analysis.output, but only the header and
+    time vector are read on creation. Field values and coordinates are mapped
+    from disk and only the requested time slice and spatial window are read.
+    Field values converted to single precision by convert_to_float32 are
+    read from the .npy file that replaces the .dat file.
+
+    Inputs:
+    problem = problem name (string)
+    name = name of output unit (string)
+    datadir = directory holding the output files
+    """
+
+    def __init__(self, problem, name, datadir):
+        self.problem = problem
+        self.name = name
+        self.datadir = datadir
+
+        # header holds field name, byte order and the number of time steps
+        # and grid points in each direction
+
+        with open(self._path(".o"), 'r') as f:
+            self.field = f.readline().strip()
+            self.endian = f.readline().strip()
+            self.nt = int(f.readline().strip())
+            self.nx = int(f.readline().strip())
+            self.ny = int(f.readline().strip())
+            self.nz = int(f.readline().strip())
+
+        self.dtype = np.dtype(self.endian + "f8")
+        self.t = np.fromfile(self._path("_t.dat"), dtype=self.dtype)
+
+    def _path(self, suffix):
+        return join(self.datadir,
+                    self.problem + "_" + self.name + suffix)
+
+    def _window(self, xslice, yslice, zslice):
+        for s in (xslice, yslice, zslice):
+            assert isinstance(s, slice), "spatial windows must be slices"
+        return (xslice, yslice, zslice)
+
+    def get_coord(self, coord, xslice=slice(None), yslice=slice(None),
+                  zslice=slice(None)):
+        """
+        returns spatial coordinate coord ('x', 'y' or 'z') over the given
+        spatial window, as a read-only view of the mapped coordinate file
+        """
+        assert coord in ('x', 'y', 'z'), "coord must be 'x', 'y' or 'z'"
+
+        c = np.memmap(self._path("_" + coord + ".dat"), dtype=self.dtype,
+                      mode='r', shape=(self.nx, self.ny, self.nz))
+
+        return np.squeeze(c[self._window(xslice, yslice, zslice)])
+
+    def get_slice(self, tidx=-1, xslice=slice(None), yslice=slice(None),
+                  zslice=slice(None)):
+        """
+        returns field values at time index tidx (negative values count from
+        the final time) over the given spatial window
+
+        Only the bytes for the requested time step are mapped, and the returned
+        array is a read-only view of the file rather than a copy.
+        """
+        tidx = int(tidx)
+        if tidx < 0:
+            tidx += self.nt
+        assert tidx >= 0 and tidx < self.nt, "time index out of range"
+
+        if exists(self._path("_" + self.field + ".npy")):
+            data = np.load(self._path("_" + self.field + ".npy"),
+                           mmap_mode='r')[tidx]
+        else:
+            frame = self.nx * self.ny * self.nz
+            data = np.memmap(self._path("_" + self.field + ".dat"),
+                             dtype=self.dtype, mode='r',
+                             offset=tidx * frame * self.dtype.itemsize,
+                             shape=(self.nx, self.ny, self.nz))
+
+        return np.squeeze(data[self._window(xslice, yslice, zslice)])
+
+    def frames(self, xslice=slice(None), yslice=slice(None),
+               zslice=slice(None)):
+        """
+        iterates over time steps, yielding the time and the field values over
+        the given spatial window, so that only one time step is read at once
+        """
+
+        for tidx in range(self.nt):
+            yield self.t[tidx], self.get_slice(tidx, xslice, yslice, zslice)
+
+
+def convert_to_float32(problem, name, datadir):
+    """
+    converts the field values of an fdfault output unit to single precision,
+    one time step at a time, replacing the .dat file with a .npy file that
+    MappedOutput reads in its place (fdfault.analysis.output cannot read it)
+    """
+
+    output = MappedOutput(problem, name, datadir)
+    data = np.lib.format.open_memmap(
+        output._path("_" + output.field + ".npy.tmp"), mode="w+",
+        dtype=np.float32, shape=(output.nt, output.nx, output.ny, output.nz))
+    for tidx in range(output.nt):
+        data[tidx] = np.reshape(output.get_slice(tidx),
+                                (output.nx, output.ny, output.nz))
+    data.flush()
+    del data
+
+    os_replace(output._path("_" + output.field + ".npy.tmp"),
+               output._path("_" + output.field + ".npy"))
+    remove(output._path("_" + output.field + ".dat"))
+
+
+def thumbnail(frame, factor):
+    """
+    downsamples a 2d field by averaging blocks of factor x factor grid points
+    (trailing points that do not fill a block are dropped)
+    """
+
+    nx = frame.shape[0] // factor
+    ny = frame.shape[1] // factor
+
+    return np.mean(np.reshape(np.asarray(frame)[:nx * factor, :ny * factor],
+                              (nx, factor, ny, factor)), axis=(1, 3))
+
+
+def snapshot_statistics(output, factor=None, xslice=slice(None),
+                        yslice=slice(None)):
+    """
+    computes the minimum, maximum, mean and root mean square of the field of
+    an output unit at each time step over the given spatial window, reading
+    one time step at a time, and thumbnails of each step downsampled by
+    factor if given (the field must then be 2d in space)
+
+    Returns a dict of arrays with one entry per time step
+    """
+
+    stats = {"t": [], "min": [], "max": [], "mean": [], "rms": []}
+    if factor is not None:
+        stats["thumbnail"] = []
+
+    for t, frame in output.frames(xslice, yslice):
+        stats["t"].append(t)
+        stats["min"].append(np.min(frame))
+        stats["max"].append(np.max(frame))
+        stats["mean"].append(np.mean(frame, dtype=np.float64))
+        stats["rms"].append(np.sqrt(np.mean(np.square(frame,
+                                                      dtype=np.float64))))
+        if factor is not None:
+            stats["thumbnail"].append(thumbnail(frame, factor))
+
+    return {key: np.array(value) for key, value in stats.items()}
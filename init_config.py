@@ -2,7 +2,11 @@ import numpy as np
 import mogp_emulator
 from optparse import OptionParser
 from pprint import pprint
-from os.path import join
+from os.path import join, exists, dirname, basename
+from os import makedirs, walk
+from utils import feasible_points
+from designs import (to_unit_cube, min_distances, maximin_augment,
+                     generate_design, design_quality)
 
 try:
     import cPickle as pickle
@@ -10,12 +14,156 @@ except ModuleNotFoundError:
     import pickle
 
 
+def screen_design(ed, input_points, screen="resample", box_points=10000):
+    """
+    checks all design points against the fault strength at once, before any
+    job is set up, and reports the feasible fraction of the parameter box
+
+    screen="resample" replaces infeasible points with feasible points drawn
+    from the box, screen="flag" only reports them.
+    Returns the screened design and the feasible fraction of the box.
+    """
+
+    assert screen in ("resample", "flag"), "screen must be 'resample' or 'flag'"
+
+    box = ed.sample(box_points)
+    box_feasible = feasible_points(box)
+    fraction = np.mean(box_feasible)
+    print("feasible fraction of parameter box : {:.4f}".format(fraction))
+
+    infeasible = np.logical_not(feasible_points(input_points))
+    n_infeasible = np.sum(infeasible)
+    if n_infeasible == 0:
+        return input_points, fraction
+
+    print("infeasible design points : {}".format(
+        np.flatnonzero(infeasible) + 1))
+
+    if screen == "resample":
+        assert fraction > 0., "no feasible points found in parameter box"
+        replacements = box[box_feasible]
+        while len(replacements) < n_infeasible:
+            box = ed.sample(box_points)
+            replacements = np.vstack((replacements, box[feasible_points(box)]))
+        input_points = np.array(input_points)
+        input_points[infeasible] = replacements[:n_infeasible]
+        print("replaced {} infeasible design points".format(n_infeasible))
+
+    return input_points, fraction
+
+
+def augment_design(ed, design, n_new, screen="resample", n_candidates=None):
+    """
+    generates n_new points to add to an existing design, chosen from a larger
+    set of candidates by a greedy maximin criterion against the existing
+    points (infeasible candidates are dropped unless screen is "none")
+    """
+
+    if n_candidates is None:
+        n_candidates = max(20 * n_new, 1000)
+
+    candidates = ed.sample(n_candidates)
+    if screen != "none":
+        candidates = candidates[feasible_points(candidates)]
+
+    existing = to_unit_cube(ed, design)
+    unit_candidates = to_unit_cube(ed, candidates)
+    new_points = candidates[maximin_augment(existing, unit_candidates, n_new)]
+
+    augmented = np.vstack((existing, to_unit_cube(ed, new_points)))
+    print("minimum distance between augmented design points : {:.4f}".format(
+        np.min(min_distances(augmented, augmented, exclude_self=True))))
+
+    return new_points
+
+
+def load_ensemble_design(directories, design_file=None):
+    """
+    reconstructs the design of an existing ensemble from the
+    sample_point_<n> folders (holding input_points.npy and ed.pickle) found
+    under directories, such as the SWEEP folder of the config before it is
+    cleaned or the results directories of the ensemble, together with the
+    points saved in design_file (design.npy) if it exists
+
+    Returns the experimental design (None if no ed.pickle or
+    design_ed.pickle is found), the design points and the number of the
+    first folder for new points.
+    """
+
+    ed = None
+    points = []
+    numbers = [0]
+
+    if design_file is not None and exists(design_file):
+        points.extend(np.load(design_file))
+        numbers.append(len(points))
+        ed_file = join(dirname(design_file), "design_ed.pickle")
+        if exists(ed_file):
+            with open(ed_file, 'rb') as input:
+                ed = pickle.load(input)
+
+    folders = []
+    for directory in directories:
+        for r, d, f in walk(directory):
+            folder = basename(r)
+            if (folder.startswith("sample_point_") and
+                    "input_points.npy" in f):
+                folders.append((int(folder[len("sample_point_"):]), r))
+
+    for number, folder in sorted(folders):
+        # input_points.npy holds one point, saved 1D in SWEEP and 2D by the
+        # simulation
+        points.append(np.atleast_2d(np.load(join(folder,
+                                                 "input_points.npy")))[0])
+        numbers.append(number)
+        if ed is None and exists(join(folder, "ed.pickle")):
+            with open(join(folder, "ed.pickle"), 'rb') as input:
+                ed = pickle.load(input)
+
+    assert len(points) > 0, "no existing design found in {}".format(
+        ", ".join(directories))
+
+    # design.npy and the SWEEP folders can hold the same points
+
+    points = np.array(points)
+    _, first = np.unique(points, axis=0, return_index=True)
+
+    return ed, points[np.sort(first)], max(numbers) + 1
+
+
+# parameter box of the demo : normal stress, shear to normal stress ratio and
+# ratio of out of plane to in plane normal stress
+
+DEFAULT_BOUNDS = [(-120., -80.), (0.1, 0.4), (0.9, 1.1)]
+
+
 def mogp_configuration_initialization(sample_points,
                                       results_dir,
-                                      isSWEEP, seed=0):
+                                      isSWEEP, seed=0, screen="resample",
+                                      augment=False, design="lhs",
+                                      bounds=None, existing=None):
+    """
+    generates a design of sample_points and saves it for the simulation jobs,
+    in SWEEP folders if isSWEEP. The full ensemble design so far is kept in
+    design.npy and design_ed.pickle (single job designs do not change them);
+    with augment, sample_points new points are added to it and only their
+    SWEEP folders are written, numbered after the existing ones. The existing
+    design is existing, as returned by load_ensemble_design, or else is read
+    from design.npy and the SWEEP folders.
+
+    design is 'lhs' (random Latin hypercube), 'maximin' (optimized Latin
+    hypercube), 'sobol' or 'halton', over the parameter box bounds (default
+    DEFAULT_BOUNDS; an augmented design keeps the box of the existing one).
+    The fault strength screen is skipped for boxes that do not have the
+    three inputs of create_problem.
+    """
+
+    sample_points = int(sample_points)
+
+    if bounds is None:
+        bounds = DEFAULT_BOUNDS
 
-    ed = mogp_emulator.LatinHypercubeDesign(
-        [(-120., -80.), (0.1, 0.4), (0.9, 1.1)])
+    ed = mogp_emulator.LatinHypercubeDesign(bounds)
 
     # We can now generate a design of sample_points by calling the sample
 
@@ -23,7 +171,42 @@ def mogp_configuration_initialization(sample_points,
         seed = None
 
     np.random.seed(seed)
-    input_points = ed.sample(sample_points)
+
+    existing_design = np.zeros((0, ed.get_n_parameters()))
+    counter = 1
+    if augment:
+        assert isSWEEP, "only ensemble designs can be augmented"
+        if existing is None:
+            existing = load_ensemble_design([join(results_dir, "SWEEP")],
+                                            join(results_dir, "design.npy"))
+        existing_ed, existing_design, counter = existing
+        if existing_ed is not None:
+            ed = existing_ed
+
+    # the fault strength depends on the three inputs of create_problem
+
+    if screen != "none" and ed.get_n_parameters() != len(DEFAULT_BOUNDS):
+        print("parameter box has {} inputs, not the {} of create_problem : "
+              "skipping the fault strength screen".format(
+                  ed.get_n_parameters(), len(DEFAULT_BOUNDS)))
+        screen = "none"
+
+    if augment:
+        input_points = augment_design(ed, existing_design, sample_points,
+                                      screen)
+    else:
+        input_points, quality = generate_design(ed, sample_points, design,
+                                                seed)
+
+        # screen the design for points that would exceed the fault strength
+
+        if screen != "none":
+            input_points, fraction = screen_design(ed, input_points, screen)
+            quality = design_quality(to_unit_cube(ed, input_points))
+
+        print("design quality : minimum distance {min_distance:.4f}, "
+              "phi_p {phi_p:.4g}, centered L2 discrepancy "
+              "{discrepancy:.4g}".format(**quality))
 
     if isSWEEP == False:
         # save input_points array data into file
@@ -31,9 +214,14 @@ def mogp_configuration_initialization(sample_points,
         with open(join(results_dir, "ed.pickle"), 'wb') as output:
             pickle.dump(ed, output, pickle.HIGHEST_PROTOCOL)
     else:
-        counter = 1
+        np.save(join(results_dir, "design.npy"),
+                np.vstack((existing_design, input_points)))
+        with open(join(results_dir, "design_ed.pickle"), 'wb') as output:
+            pickle.dump(ed, output, pickle.HIGHEST_PROTOCOL)
+
         for point in input_points:
             folder_name = "sample_point_" + str(counter)
+            makedirs(join(results_dir, "SWEEP", folder_name), exist_ok=True)
             np.save(join(results_dir, "SWEEP", folder_name,
                          "input_points.npy"), point)
             counter += 1
@@ -1,18 +1,29 @@
 import numpy as np
 import matplotlib.pyplot as plt
 import mogp_emulator
-from earthquake import create_problem, run_simulation, compute_moment
+from earthquake import create_problem, run_simulation, extract_quantities
+from utils import problem_size
+from fdfault_io import convert_to_float32
+from designs import qmc_sample, qmc_sampler, transform_to_design
+from sparse_gp import FITCGaussianProcess
 import sys
 from pprint import pprint
-from os.path import join, dirname, exists
-from os import walk, makedirs
+from os.path import join, dirname, exists, abspath
+from os import walk, makedirs, remove
+import json
+from multiprocessing import Pool
+from time import perf_counter
+from scipy.optimize import minimize, nnls
+from scipy.stats import t as student_t
+from scipy.linalg import cho_factor, cho_solve
 try:
     import cPickle as pickle
 except ModuleNotFoundError:
     import pickle
 
 
-def run_fdfault_simulation(mpi_exec, fdfault_exec, results_dir):
+def run_fdfault_simulation(mpi_exec, fdfault_exec, results_dir,
+                           share_inputs=False, n_proc=4):
 
     input_points = np.load(join(results_dir, "input_points.npy"))
 
@@ -27,65 +38,577 @@ def run_fdfault_simulation(mpi_exec, fdfault_exec, results_dir):
     # actually simulate them, and compute_moment to load the data and compute
     # the earthquake size. The simulation is parallelized, so if you have
     # multiple cores available you can specify more processors to run the
-    # simulation.
+    # simulation. Ensemble members can share the input files that do not
+    # depend on the stresses, stored once alongside the ensemble run folders.
+    shared_dir = None
+    if share_inputs:
+        shared_dir = join(dirname(abspath(results_dir)), "shared_inputs")
+
+    # The run time and peak memory per process of each simulation are
+    # recorded in timing.json to build the cost model used to set scheduler
+    # requests. Each process reports its own peak, so that ranks started on
+    # other nodes are included and earlier simulations do not carry over.
+    nt, nx, ny = problem_size()
+    timings = []
+
+    # Wavefield snapshot outputs are configured by an optional snapshots.json
+    # holding a list of keyword arguments for earthquake.snapshot_output
+    snapshots = []
+    if exists(join(results_dir, "snapshots.json")):
+        with open(join(results_dir, "snapshots.json")) as f:
+            snapshots = json.load(f)
+
     counter = 1
     for point in input_points:
         name = "simulation_{}".format(counter)
-        create_problem(point, name=name, output_dir=results_dir)
-        run_simulation(name=name, n_proc=4, mpi_exec=mpi_exec,
-                       fdfault_exec=fdfault_exec, output_dir=results_dir)
+        create_problem(point, name=name, output_dir=results_dir,
+                       shared_dir=shared_dir, snapshots=snapshots)
+        start = perf_counter()
+        max_rss_mb = run_simulation(name=name, n_proc=n_proc,
+                                    mpi_exec=mpi_exec,
+                                    fdfault_exec=fdfault_exec,
+                                    output_dir=results_dir,
+                                    measure_memory=True)
+        timings.append({"name": name, "nt": nt, "nx": nx, "ny": ny,
+                        "n_proc": n_proc,
+                        "wall_time": perf_counter() - start,
+                        "max_rss_mb": max_rss_mb})
+        for snapshot in snapshots:
+            if snapshot.get("float32", False):
+                convert_to_float32(name, snapshot.get("name", "vybody"),
+                                   join(results_dir, "data"))
         counter += 1
 
+    with open(join(results_dir, "timing.json"), 'w') as f:
+        json.dump(timings, f, indent=2)
+
     # save input_points array data into file
     np.save('input_points.npy', input_points)
 
 
-def load_results(results_dir):
+def fit_strong_scaling(n_procs, times):
+    """
+    fits run times measured at several process counts with the model
+    t(p) = a + b/p + c*p (serial part, parallel part and communication
+    overhead, all non-negative) and returns (a, b, c)
+    """
+
+    n_procs = np.array(n_procs, dtype=float)
+    A = np.column_stack((np.ones(len(n_procs)), 1. / n_procs, n_procs))
+    coefficients, residual = nnls(A, np.array(times, dtype=float))
+
+    return coefficients
+
+
+def best_ensemble_n_proc(coefficients, cores):
+    """
+    returns the process count per simulation that maximizes the number of
+    simulations completed per unit time when cores are shared by
+    simultaneous ensemble members
+    """
+
+    a, b, c = coefficients
+    n_procs = np.arange(1, int(cores) + 1)
+    throughput = (cores // n_procs) / (a + b / n_procs + c * n_procs)
+
+    return int(n_procs[np.argmax(throughput)])
+
+
+def tune_n_proc(mpi_exec, fdfault_exec, results_dir, n_procs, refine=1,
+                probe_nt=101, cores=None):
+    """
+    runs short probe simulations (probe_nt time steps) with each process count
+    in n_procs, fits a strong scaling curve and saves the measurements and the
+    process count giving the best ensemble throughput on cores cores (default
+    is the largest count probed) to n_proc_tuning.json
+    """
+
+    if cores is None:
+        cores = max(n_procs)
+
+    point = np.array([-100., 0.25, 1.])
+    times = []
+    for n_proc in n_procs:
+        name = "probe_{}".format(n_proc)
+        create_problem(point, name=name, refine=refine, output_dir=results_dir,
+                       nt=probe_nt)
+        start = perf_counter()
+        run_simulation(name=name, n_proc=n_proc, mpi_exec=mpi_exec,
+                       fdfault_exec=fdfault_exec, output_dir=results_dir)
+        times.append(perf_counter() - start)
+        print("n_proc {:4d} : {:.3f} s".format(n_proc, times[-1]))
+
+    coefficients = fit_strong_scaling(n_procs, times)
+    best = best_ensemble_n_proc(coefficients, cores)
+    print("best n_proc for ensembles on {} cores : {}".format(cores, best))
+
+    with open(join(results_dir, "n_proc_tuning.json"), 'w') as f:
+        json.dump({"refine": refine, "probe_nt": probe_nt, "cores": cores,
+                   "n_proc": list(n_procs), "time": times,
+                   "coefficients": list(coefficients), "best_n_proc": best},
+                  f, indent=2)
+
+
+def load_design(results_dir):
+    """
+    loads the experimental design saved alongside the simulations in
+    results_dir
+    """
+
+    for r, d, f in walk(results_dir):
+        if "ed.pickle" in f:
+            with open(join(r, "ed.pickle"), 'rb') as input:
+                return pickle.load(input)
+
+    raise FileNotFoundError("no ed.pickle found in " + results_dir)
+
+
+def load_results(results_dirs, quantities=("moment",)):
+    """
+    loads the inputs and the quantities of interest (names of extractors in
+    earthquake.EXTRACTORS) of all simulations in results_dirs (one results
+    directory or a list of them, such as an ensemble and its augmentations),
+    reading the output of each simulation once
+
+    Returns the inputs, the results with one column per quantity and the
+    experimental design. The table of inputs and results is also saved to
+    results/quantities.txt in the first results directory
+    """
+
+    if isinstance(results_dirs, str):
+        results_dirs = [results_dirs]
 
     ed = None
     input_points = []
     results = []
-    # walk through all files in results_dir
-    for r, d, f in walk(results_dir):
-        # r=root, d=directories, f = files
-        for file in f:
-            if file == 'simulation_1.in':
-                result = compute_moment(
-                    name="simulation_1", results_dir=dirname(r))
-                results.append(result)
-            elif file == 'input_points.npy':
-                input_points.append(np.load(join(r, file))[0])
-            elif file == "ed.pickle" and ed is None:
-                with open(join(r, file), 'rb') as input:
-                    ed = pickle.load(input)
+    # walk through all files in results_dirs
+    for results_dir in results_dirs:
+        for r, d, f in walk(results_dir):
+            # r=root, d=directories, f = files
+            for file in f:
+                if file == 'simulation_1.in':
+                    result = extract_quantities(
+                        name="simulation_1", quantities=quantities,
+                        results_dir=dirname(r))
+                    results.append(result)
+                elif file == 'input_points.npy':
+                    input_points.append(np.load(join(r, file))[0])
+                elif file == "ed.pickle" and ed is None:
+                    with open(join(r, file), 'rb') as input:
+                        ed = pickle.load(input)
 
     input_points = np.array(input_points)
     results = np.array(results)
 
+    results_dir = results_dirs[0]
+    makedirs(join(results_dir, "results"), exist_ok=True)
+    np.savetxt(join(results_dir, "results", "quantities.txt"),
+               np.column_stack((input_points, results)),
+               header="syy ston sxtosy " + " ".join(quantities))
+
     return input_points, results, ed
 
-def run_mogp_analysis(analysis_points, known_value, threshold, results_dir):
+# training data shared with the worker processes of fit_GP_MAP_parallel,
+# set once per worker by the pool initializer rather than sent with each task
 
-    input_points, results, ed = load_results(results_dir)
+_fit_inputs = None
+_fit_targets = None
 
-    # fit GP to simulations
 
-    gp = mogp_emulator.GaussianProcess(input_points, results)
-    gp = mogp_emulator.fit_GP_MAP(gp)
+def _init_fit_worker(inputs, targets):
+    global _fit_inputs, _fit_targets
+    _fit_inputs = inputs
+    _fit_targets = targets
 
-    # We can now make predictions for a large number of input points much
-    # more quickly than running the simulation.
 
-    query_points = ed.sample(analysis_points)
-    predictions = gp.predict(query_points)
+def _fit_restart(args):
+    """
+    runs a single MAP minimization from the given starting point
+    """
+
+    restart, theta0 = args
+    gp = mogp_emulator.GaussianProcess(_fit_inputs, _fit_targets)
+    start = perf_counter()
+    try:
+        min_dict = minimize(gp.logposterior, theta0, method="L-BFGS-B",
+                            jac=gp.logpost_deriv)
+        theta, logpost = min_dict["x"], min_dict["fun"]
+    except (np.linalg.LinAlgError, FloatingPointError, ValueError):
+        theta, logpost = theta0, np.inf
+
+    return restart, perf_counter() - start, logpost, theta
+
+
+def fit_GP_MAP_parallel(inputs, targets, n_tries=15, processes=None,
+                        seed=None):
+    """
+    fits the GP hyperparameters by running n_tries MAP minimizations from
+    random starting points concurrently in a process pool
+
+    processes is the number of worker processes (None uses all cores).
+    Returns the GP fit with the best (lowest negative) log-posterior and a list
+    of (restart, wall time, negative log-posterior, theta) for each restart.
+    """
+
+    gp = mogp_emulator.GaussianProcess(inputs, targets)
+
+    # draw starting points as mogp_emulator.fit_GP_MAP does: from the priors
+    # (0.5 and later) or uniformly on [-2.5, 2.5] (0.4, which has no
+    # sampling method on its priors)
+
+    if hasattr(getattr(gp, "priors", None), "sample"):
+        if seed is not None:
+            np.random.seed(seed)
+        theta0 = np.array([gp.priors.sample() for _ in range(int(n_tries))])
+    else:
+        prng = np.random.RandomState(seed)
+        theta0 = 5. * (prng.random_sample((int(n_tries), gp.n_params)) - 0.5)
+
+    with Pool(processes, initializer=_init_fit_worker,
+              initargs=(gp.inputs, gp.targets)) as pool:
+        restarts = pool.map(_fit_restart, enumerate(theta0))
+
+    best = min(restarts, key=lambda r: r[2])
+    assert np.isfinite(best[2]), "all minimization attempts failed"
+    gp.fit(best[3])
+
+    return gp, restarts
+
+
+def save_fit_restarts(restarts, results_dir):
+    """
+    prints the timing and optimum of each restart and saves them to
+    results/fit_restarts.txt
+    """
+
+    print("restart  time (s)  -logpost")
+    for restart, elapsed, logpost, theta in restarts:
+        print("{:7d}  {:8.3f}  {:.6g}".format(restart, elapsed, logpost))
+
+    makedirs(join(results_dir, "results"), exist_ok=True)
+    np.savetxt(join(results_dir, "results", "fit_restarts.txt"),
+               [np.hstack((r[:3], r[3])) for r in restarts],
+               header="restart wall_time neg_logpost theta")
+
+
+def save_emulator(gp, filename):
+    """
+    saves the training data, fitted hyperparameters (as a float array) and
+    nugget of gp to an npz file
+    """
+
+    theta = gp.theta
+    if hasattr(theta, "get_data"):
+        # mogp_emulator 0.5 and later hold the hyperparameters in a GPParams
+        # object, and keep an adaptive nugget apart from them
+        theta = theta.get_data()
+
+    np.savez(filename, inputs=gp.inputs, targets=gp.targets,
+             theta=np.asarray(theta, dtype=float), nugget=float(gp.nugget))
+
+
+def load_emulator(filename):
+    """
+    loads a GP saved with save_emulator, refitting it at the saved
+    hyperparameters and nugget (a single factorization, no minimization)
+    """
+
+    emulator = np.load(filename)
+    gp = mogp_emulator.GaussianProcess(emulator["inputs"],
+                                       emulator["targets"],
+                                       nugget=float(emulator["nugget"]))
+    gp.fit(emulator["theta"])
+
+    return gp
+
+
+def leave_one_out(gp):
+    """
+    computes leave-one-out predictive means and variances of a fitted
+    (zero mean) GP in closed form from a single factorization of its
+    covariance matrix (Rasmussen and Williams, 2006, section 5.4.2), rather
+    than refitting once for each training point
+
+    Returns the means, variances and standardized errors
+    """
+
+    Q = np.array(gp.get_K_matrix())
+    Q[np.diag_indices_from(Q)] += gp.nugget
+
+    Qinv = cho_solve(cho_factor(Q), np.eye(len(Q)))
+    alpha = Qinv.dot(gp.targets)
+
+    var = 1. / np.diag(Qinv)
+    mean = gp.targets - alpha * var
+    errors = (gp.targets - mean) / np.sqrt(var)
+
+    return mean, var, errors
+
+
+def validate_emulator(gp, results_dir, min_coverage=0.):
+    """
+    saves leave-one-out diagnostics of gp to results/loo_diagnostics.txt and
+    prints the coverage of the 1, 2 and 3 standard deviation intervals
+
+    Raises a RuntimeError if the coverage of the 2 standard deviation
+    interval is below min_coverage (nominally it is 0.954).
+    """
+
+    mean, var, errors = leave_one_out(gp)
+
+    nominal = [0.683, 0.954, 0.997]
+    coverage = [np.mean(np.abs(errors) <= k) for k in (1., 2., 3.)]
+    header = "".join(["{} sd coverage {:.3f} (nominal {})\n".format(
+        k, c, n) for k, c, n in zip((1, 2, 3), coverage, nominal)])
+    print(header, end="")
+
+    makedirs(join(results_dir, "results"), exist_ok=True)
+    np.savetxt(join(results_dir, "results", "loo_diagnostics.txt"),
+               np.column_stack((gp.inputs, gp.targets, mean, var, errors)),
+               header=header + "syy ston sxtosy target loo_mean loo_var "
+                               "standardized_error")
+
+    if coverage[1] < min_coverage:
+        raise RuntimeError("emulator is poorly calibrated: 2 sd leave-one-out "
+                           "coverage {:.3f} is below {}".format(coverage[1],
+                                                                min_coverage))
+
+
+def estimate_nroy_fraction(gp, ed, known_value, threshold, tolerance=0.01,
+                           batch_points=1024, replicates=8, method="sobol",
+                           max_points=2**20, min_batches=2, seed=None):
+    """
+    estimates the fraction of the parameter space that is not ruled out yet
+    using randomized quasi Monte Carlo
+
+    replicates independently scrambled low discrepancy sequences are extended
+    by batch_points each (rounded up to a power of 2 for Sobol sequences)
+    until, after at least min_batches batches, the 95% confidence interval
+    half width of the NROY fraction is below tolerance, or max_points have
+    been evaluated in total. The half width is taken from the spread between
+    replicates, but is at least 3/(points evaluated), the 95% bound when no
+    point (or every point) is NROY, as the replicates then all agree. The
+    points of each batch are predicted in a single call to gp.predict.
+
+    Returns the fraction, its confidence interval half width, and the query
+    points, predicted means and variances, implausibility and NROY indices
+    for all points evaluated.
+    """
+
+    assert replicates > 1, "at least two replicates are needed for the error"
+
+    if method == "sobol":
+        batch_points = 2**int(np.ceil(np.log2(batch_points)))
+
+    prng = np.random.RandomState(seed)
+    samplers = [qmc_sampler(ed, method, prng.randint(2**31))
+                for r in range(replicates)]
+
+    n_nroy = np.zeros(replicates)
+    query_points = []
+    predictions = []
+    implaus = []
+
+    while True:
+        unit_points = np.vstack([sampler.random(batch_points)
+                                 for sampler in samplers])
+        points = transform_to_design(ed, unit_points)
+        batch_predictions = gp.predict(points)
+        hm = mogp_emulator.HistoryMatching(obs=known_value,
+                                           expectations=batch_predictions,
+                                           threshold=threshold)
+        nroy = np.zeros(len(points), dtype=bool)
+        nroy[hm.get_NROY()] = True
+        n_nroy += np.sum(nroy.reshape(replicates, batch_points), axis=1)
+
+        query_points.append(points)
+        predictions.append(np.column_stack((batch_predictions[0],
+                                            batch_predictions[1])))
+        implaus.append(hm.get_implausibility())
+
+        n_points = len(query_points) * batch_points
+        fractions = n_nroy / n_points
+        fraction = np.mean(fractions)
+        half_width = max(student_t.ppf(0.975, replicates - 1) *
+                         np.std(fractions, ddof=1) / np.sqrt(replicates),
+                         3. / (n_points * replicates))
+        print("NROY fraction {:.5f} +/- {:.5f} from {} points".format(
+            fraction, half_width, n_points * replicates))
+
+        if ((half_width <= tolerance and len(query_points) >= min_batches) or
+                n_points * replicates >= max_points):
+            break
+
+    query_points = np.vstack(query_points)
+    predictions = np.vstack(predictions)
+    implaus = np.concatenate(implaus)
+    NROY = np.flatnonzero(implaus <= threshold)
+
+    return (fraction, half_width, query_points,
+            (predictions[:, 0], predictions[:, 1]), implaus, NROY)
+
+
+def implausibility_sweep(predictions, known_values, obs_vars, thresholds):
+    """
+    evaluates the implausibility of the predicted means and variances for
+    every combination of observed value and observation variance, and the
+    NROY masks for every threshold, in one vectorized pass
+
+    Returns implausibility of shape (n_obs, n_var, n_points) and NROY masks
+    of shape (n_obs, n_var, n_threshold, n_points)
+    """
+
+    mean = np.asarray(predictions[0])
+    unc = np.asarray(predictions[1])
+
+    obs = np.asarray(known_values, dtype=float)[:, np.newaxis, np.newaxis]
+    var = (np.asarray(obs_vars, dtype=float)[np.newaxis, :, np.newaxis] +
+           unc[np.newaxis, np.newaxis, :])
+    implaus = np.abs(mean - obs) / np.sqrt(var)
+
+    thresholds = np.asarray(thresholds, dtype=float)
+    nroy = implaus[:, :, np.newaxis, :] <= thresholds[:, np.newaxis]
+
+    return implaus, nroy
+
+
+def save_implausibility_sweep(nroy, known_values, obs_vars, thresholds,
+                              results_dir):
+    """
+    saves the NROY fraction of every combination of observed value,
+    observation variance and threshold to results/nroy_sweep.txt, and the
+    NROY masks (packed to bits along the points) to results/nroy_masks.npz
+    """
+
+    grid = np.meshgrid(known_values, obs_vars, thresholds, indexing="ij")
+    table = np.column_stack([g.ravel() for g in grid] +
+                            [np.mean(nroy, axis=-1).ravel()])
+
+    makedirs(join(results_dir, "results"), exist_ok=True)
+    np.savetxt(join(results_dir, "results", "nroy_sweep.txt"), table,
+               header="known_value obs_var threshold nroy_fraction")
+    np.savez_compressed(join(results_dir, "results", "nroy_masks.npz"),
+                        masks=np.packbits(nroy, axis=-1),
+                        n_points=nroy.shape[-1], known_values=known_values,
+                        obs_vars=obs_vars, thresholds=thresholds)
+
+
+def run_mogp_analysis(analysis_points, known_value, threshold, results_dir,
+                      n_tries=15, fit_processes=1, sampler="lhs",
+                      nroy_tolerance=0., quantity="moment", quantities=(),
+                      loo_min_coverage=0., obs_var=0., emulator="exact",
+                      n_inducing=200):
+
+    # known_value, obs_var and threshold may be lists of values to sweep over.
+    # The first combination is used for history matching and the plots.
+    # results_dir may be a list of results directories whose simulations are
+    # all used, with the analysis saved in the first.
+
+    results_dirs = results_dir
+    if isinstance(results_dir, (list, tuple)):
+        results_dir = results_dir[0]
+
+    known_values = np.atleast_1d(np.asarray(known_value, dtype=float))
+    obs_vars = np.atleast_1d(np.asarray(obs_var, dtype=float))
+    thresholds = np.atleast_1d(np.asarray(threshold, dtype=float))
+    obs = (known_values[0], obs_vars[0])
+    threshold = thresholds[0]
+
+    # extract quantity, which is emulated, and any other quantities in a single
+    # pass over the simulation outputs
+
+    quantities = [quantity] + [q for q in quantities if q != quantity]
+    input_points, results, ed = load_results(results_dirs, quantities)
+    results = results[:, 0]
+
+    # fit GP to simulations. With fit_processes other than 1 the restarts of
+    # the hyperparameter fit run concurrently (0 uses all available cores).
+    # For large ensembles emulator="fitc" uses an inducing point approximation
+    # with n_inducing points instead of the exact GP.
+
+    assert emulator in ("exact", "fitc"), "emulator must be 'exact' or 'fitc'"
+    assert emulator == "exact" or loo_min_coverage <= 0., \
+        "leave-one-out validation (loo_min_coverage) requires emulator='exact'"
+
+    if emulator == "fitc":
+        gp = FITCGaussianProcess(input_points, results, n_inducing,
+                                 n_tries=n_tries)
+    elif fit_processes == 1:
+        gp = mogp_emulator.GaussianProcess(input_points, results)
+        gp = mogp_emulator.fit_GP_MAP(gp, n_tries=n_tries)
+    else:
+        gp, restarts = fit_GP_MAP_parallel(input_points, results, n_tries,
+                                           fit_processes or None)
+        save_fit_restarts(restarts, results_dir)
+
+    makedirs(join(results_dir, "results"), exist_ok=True)
+
+    # save the emulator, and check it if requested, before using it for
+    # history matching (the closed form leave-one-out validation requires the
+    # exact GP). The FITC emulator is not saved. Files left by an earlier
+    # analysis are removed so they are not used in place of this one.
 
-    # set up history matching
+    stale = []
+    if emulator == "exact":
+        save_emulator(gp, join(results_dir, "results", "emulator.npz"))
+    else:
+        stale.append("emulator.npz")
 
-    hm = mogp_emulator.HistoryMatching(obs=known_value, expectations=predictions,
-                                       threshold=threshold)
+    if loo_min_coverage > 0.:
+        validate_emulator(gp, results_dir, loo_min_coverage)
+    else:
+        stale.append("loo_diagnostics.txt")
 
-    implaus = hm.get_implausibility()
-    NROY = hm.get_NROY()
+    for filename in stale:
+        if exists(join(results_dir, "results", filename)):
+            remove(join(results_dir, "results", filename))
+
+    # We can now make predictions for a large number of input points much
+    # more quickly than running the simulation. With a nroy_tolerance the
+    # number of points is increased in batches of analysis_points until the
+    # NROY fraction is known to that precision.
+
+    if nroy_tolerance > 0.:
+        replicates = 8
+        fraction, half_width, query_points, predictions, implaus, NROY = \
+            estimate_nroy_fraction(gp, ed, obs, threshold,
+                                   nroy_tolerance,
+                                   max(analysis_points // replicates, 1),
+                                   replicates,
+                                   "sobol" if sampler == "lhs" else sampler)
+    else:
+        if sampler == "lhs":
+            query_points = ed.sample(analysis_points)
+        elif sampler == "sobol":
+            # Sobol sequences are only balanced for a power of 2 points
+            query_points = qmc_sample(
+                ed, 2**int(np.ceil(np.log2(analysis_points))), sampler)
+        else:
+            query_points = qmc_sample(ed, analysis_points, sampler)
+        predictions = gp.predict(query_points)
+
+        # set up history matching
+
+        hm = mogp_emulator.HistoryMatching(obs=obs,
+                                           expectations=predictions,
+                                           threshold=threshold)
+
+        implaus = hm.get_implausibility()
+        NROY = hm.get_NROY()
+        fraction = len(NROY) / len(query_points)
+        half_width = np.nan
+
+    np.savetxt(join(results_dir, "results", "nroy_fraction.txt"),
+               [[fraction, half_width, len(query_points)]],
+               header="nroy_fraction ci95_half_width n_points")
+
+    # reuse the predictions for all other observations and thresholds
+
+    if len(known_values) * len(obs_vars) * len(thresholds) > 1:
+        _, nroy = implausibility_sweep(predictions, known_values, obs_vars,
+                                       thresholds)
+        save_implausibility_sweep(nroy, known_values, obs_vars, thresholds,
+                                  results_dir)
 
     # make some plots
 
@@ -129,7 +652,33 @@ if __name__ == "__main__":
             print("Error : input sample points should be integer value !")
             exit()
 
-        run_fdfault_simulation(mpi_exec, fdfault_exec, results_dir)
+        share_inputs = len(sys.argv) > 6 and sys.argv[6] == "1"
+
+        try:
+            n_proc = int(sys.argv[7]) if len(sys.argv) > 7 else 4
+        except ValueError:
+            print("Error : n_proc should be integer value !")
+            exit()
+
+        run_fdfault_simulation(mpi_exec, fdfault_exec, results_dir,
+                               share_inputs, n_proc)
+
+    elif mood == "tune_n_proc":
+        mpi_exec = sys.argv[2]
+        fdfault_exec = sys.argv[3]
+        results_dir = sys.argv[4]
+
+        try:
+            n_procs = [int(n) for n in sys.argv[5].split(",")]
+            refine = int(sys.argv[6])
+            probe_nt = int(sys.argv[7])
+            cores = int(sys.argv[8]) or None
+        except ValueError:
+            print("Error : process counts, refine, probe_nt and cores should be integer values !")
+            exit()
+
+        tune_n_proc(mpi_exec, fdfault_exec, results_dir, n_procs, refine,
+                    probe_nt, cores)
 
     elif mood == "analysis":
         try:
@@ -147,6 +696,6 @@ if __name__ == "__main__":
         except ValueError:
             print("Error: threshold must be a float")
             exit()
-        results_dir = sys.argv[5]
+        results_dir = sys.argv[5].split(";")
 
         run_mogp_analysis(analysis_points, known_value, threshold, results_dir)
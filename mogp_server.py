@@ -0,0 +1,225 @@
+import numpy as np
+import mogp_emulator
+from mogp_emulator.GaussianProcess import PredictResult
+import sys
+import json
+import threading
+from queue import Queue, Empty
+from time import perf_counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from mogp_functions import load_emulator
+
+
+class PredictionBatcher(object):
+    """
+    Evaluates emulator predictions for concurrent requests in micro-batches
+
+    Requests arriving within max_wait seconds of each other (up to max_batch
+    points in total) are stacked and predicted with a single call to
+    gp.predict by a worker thread. Request latency and throughput counters
+    are kept for reporting.
+    """
+
+    def __init__(self, gp, max_batch=10000, max_wait=0.002):
+        self.gp = gp
+        self.max_batch = int(max_batch)
+        self.max_wait = float(max_wait)
+        self.requests = Queue()
+
+        self.lock = threading.Lock()
+        self.start_time = perf_counter()
+        self.n_requests = 0
+        self.n_points = 0
+        self.n_batches = 0
+        self.total_latency = 0.
+        self.max_latency = 0.
+
+        worker = threading.Thread(target=self._run, daemon=True)
+        worker.start()
+
+    def predict(self, points):
+        """
+        returns predicted mean and variance at points (shape (n, D))
+        """
+
+        points = np.atleast_2d(np.array(points, dtype=float))
+        assert points.shape[1] == self.gp.D, "points have the wrong number of inputs"
+
+        start = perf_counter()
+        request = {"points": points, "done": threading.Event()}
+        self.requests.put(request)
+        request["done"].wait()
+        latency = perf_counter() - start
+
+        with self.lock:
+            self.n_requests += 1
+            self.n_points += len(points)
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+
+        if "error" in request:
+            raise request["error"]
+
+        return request["mean"], request["unc"]
+
+    def implausibility(self, points, obs, threshold=3.):
+        """
+        returns implausibility at points for the observation obs (a value or
+        a (value, variance) pair) and whether each point is NROY
+        """
+
+        # HistoryMatching takes a float or the pair as a list of floats
+
+        if np.ndim(obs) == 0:
+            obs = float(obs)
+        else:
+            obs = [float(v) for v in obs]
+
+        mean, unc = self.predict(points)
+        hm = mogp_emulator.HistoryMatching(
+            obs=obs, expectations=PredictResult(mean=mean, unc=unc, deriv=None),
+            threshold=threshold)
+        implaus = hm.get_implausibility()
+
+        return implaus, implaus <= threshold
+
+    def stats(self):
+        """
+        returns request, batch, latency and throughput counters
+        """
+
+        with self.lock:
+            elapsed = perf_counter() - self.start_time
+            return {"requests": self.n_requests,
+                    "points": self.n_points,
+                    "batches": self.n_batches,
+                    "mean_latency": self.total_latency / max(self.n_requests, 1),
+                    "max_latency": self.max_latency,
+                    "requests_per_second": self.n_requests / elapsed,
+                    "points_per_second": self.n_points / elapsed}
+
+    def _run(self):
+        while True:
+            batch = [self.requests.get()]
+            n_points = len(batch[0]["points"])
+            deadline = perf_counter() + self.max_wait
+            while n_points < self.max_batch:
+                try:
+                    request = self.requests.get(
+                        timeout=max(deadline - perf_counter(), 0.))
+                except Empty:
+                    break
+                batch.append(request)
+                n_points += len(request["points"])
+
+            try:
+                predictions = self.gp.predict(
+                    np.vstack([request["points"] for request in batch]))
+                splits = np.cumsum([len(request["points"])
+                                    for request in batch])[:-1]
+                for request, mean, unc in zip(batch,
+                                              np.split(predictions[0], splits),
+                                              np.split(predictions[1], splits)):
+                    request["mean"] = mean
+                    request["unc"] = unc
+            except Exception as e:
+                for request in batch:
+                    request["error"] = e
+
+            with self.lock:
+                self.n_batches += 1
+
+            for request in batch:
+                request["done"].set()
+
+
+class PredictionHandler(BaseHTTPRequestHandler):
+    """
+    JSON requests for the emulator server:
+
+    POST /predict {"points": [[...], ...]}
+        returns {"mean": [...], "unc": [...]}
+    POST /implausibility {"points": [[...], ...], "obs": value or [value, variance],
+                          "threshold": 3.}
+        returns {"implausibility": [...], "nroy": [...]}
+    GET /stats
+        returns latency and throughput counters
+    """
+
+    batcher = None
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self._reply(200, self.batcher.stats())
+        else:
+            self._reply(404, {"error": "unknown path " + self.path})
+
+    def do_POST(self):
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            query = json.loads(self.rfile.read(length))
+            if self.path == "/predict":
+                mean, unc = self.batcher.predict(query["points"])
+                self._reply(200, {"mean": mean.tolist(), "unc": unc.tolist()})
+            elif self.path == "/implausibility":
+                implaus, nroy = self.batcher.implausibility(
+                    query["points"], query["obs"], query.get("threshold", 3.))
+                self._reply(200, {"implausibility": implaus.tolist(),
+                                  "nroy": nroy.tolist()})
+            else:
+                self._reply(404, {"error": "unknown path " + self.path})
+        except (ValueError, KeyError, TypeError, AssertionError) as e:
+            self._reply(400, {"error": str(e)})
+
+    def _reply(self, code, content):
+        body = json.dumps(content).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class EmulatorServer(ThreadingHTTPServer):
+    """
+    threaded server with a listen backlog large enough for many concurrent
+    clients (the default of 5 resets connections under load)
+    """
+
+    request_queue_size = 128
+
+
+def serve_emulator(emulator_file, port=8765, max_batch=10000, max_wait=0.002):
+    """
+    loads an emulator saved by run_mogp_analysis once and answers prediction
+    and implausibility queries on localhost:port until interrupted
+    """
+
+    gp = load_emulator(emulator_file)
+
+    PredictionHandler.batcher = PredictionBatcher(gp, max_batch, max_wait)
+    server = EmulatorServer(("127.0.0.1", int(port)), PredictionHandler)
+    print("serving {} on http://127.0.0.1:{}".format(emulator_file, port))
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(PredictionHandler.batcher.stats())
+
+
+if __name__ == "__main__":
+
+    emulator_file = sys.argv[1]
+    try:
+        port = int(sys.argv[2]) if len(sys.argv) > 2 else 8765
+    except ValueError:
+        print("Error: port must be an integer")
+        exit()
+
+    serve_emulator(emulator_file, port)
@@ -0,0 +1,136 @@
+import numpy as np
+from os.path import join
+from os import makedirs
+from multiprocessing import Pool
+from designs import transform_to_design
+from mogp_functions import load_emulator, load_design
+
+# names of the inputs of create_problem, for reporting
+
+INPUT_NAMES = ["syy", "ston", "sxtosy"]
+
+# emulator and design used by chunk_statistics, set once per worker process
+
+_gp = None
+_ed = None
+
+
+def _init_sensitivity_worker(emulator_file, ed):
+    global _gp, _ed
+    _gp = load_emulator(emulator_file)
+    _ed = ed
+
+
+def chunk_statistics(args):
+    """
+    draws a chunk of n_chunk Saltelli sample pairs (A, B and the D matrices
+    AB_i with column i taken from B) and returns the sums needed for the
+    Sobol indices, predicting all (D + 2) * n_chunk points in one call
+
+    Returns an array holding n_chunk, the sum and sum of squares of the
+    outputs at A and B, and for each input the sums of fB*(fAB_i - fA)
+    (first order, Saltelli et al. 2010) and (fA - fAB_i)**2 (total, Jansen)
+    """
+
+    n_chunk, seed = args
+
+    D = _ed.get_n_parameters()
+    prng = np.random.RandomState(seed)
+    unit_A = prng.random_sample((n_chunk, D))
+    unit_B = prng.random_sample((n_chunk, D))
+    unit_AB = np.tile(unit_A, (D, 1, 1))
+    for i in range(D):
+        unit_AB[i, :, i] = unit_B[:, i]
+
+    points = transform_to_design(_ed, np.vstack((unit_A, unit_B,
+                                                 unit_AB.reshape(-1, D))))
+    f = _gp.predict(points)[0]
+    fA = f[:n_chunk]
+    fB = f[n_chunk:2 * n_chunk]
+    fAB = f[2 * n_chunk:].reshape(D, n_chunk)
+
+    fAB_B = np.concatenate((fA, fB))
+
+    return np.hstack(([n_chunk, np.sum(fAB_B), np.sum(fAB_B**2)],
+                      np.sum(fB * (fAB - fA), axis=1),
+                      np.sum((fA - fAB)**2, axis=1)))
+
+
+def sobol_indices(stats):
+    """
+    returns first order and total Sobol indices from the summed chunk
+    statistics of chunk_statistics
+    """
+
+    n, sum_f, sum_f2 = stats[:3]
+    D = (len(stats) - 3) // 2
+
+    var = sum_f2 / (2. * n) - (sum_f / (2. * n))**2
+    first = stats[3:3 + D] / n / var
+    total = stats[3 + D:] / (2. * n) / var
+
+    return first, total
+
+
+def run_sensitivity(emulator_file, ed, n_samples=2**20, chunk_size=2**14,
+                    processes=1, n_bootstrap=1000, seed=None):
+    """
+    estimates first order and total Sobol indices of the emulator mean using
+    n_samples Saltelli sample pairs, predicted in chunks of chunk_size so that
+    memory use does not grow with n_samples. Chunks are spread over a pool of
+    processes if processes is not 1 (None uses all cores).
+
+    Only the sums for each chunk are kept. Confidence intervals (95%) come from
+    bootstrap resampling of the chunks, so there should be at least ~20 chunks.
+
+    Returns first order and total indices and their intervals, shape (2, D)
+    """
+
+    n_chunks = max(int(n_samples) // int(chunk_size), 1)
+    prng = np.random.RandomState(seed)
+    chunks = [(int(chunk_size), s) for s in prng.randint(2**31, size=n_chunks)]
+
+    if processes == 1:
+        _init_sensitivity_worker(emulator_file, ed)
+        stats = np.array([chunk_statistics(chunk) for chunk in chunks])
+    else:
+        with Pool(processes, initializer=_init_sensitivity_worker,
+                  initargs=(emulator_file, ed)) as pool:
+            stats = np.array(list(pool.imap_unordered(chunk_statistics,
+                                                      chunks)))
+
+    first, total = sobol_indices(np.sum(stats, axis=0))
+
+    resampled = [sobol_indices(np.sum(stats[prng.randint(n_chunks,
+                                                         size=n_chunks)],
+                                      axis=0))
+                 for b in range(int(n_bootstrap))]
+    first_ci = np.percentile([r[0] for r in resampled], [2.5, 97.5], axis=0)
+    total_ci = np.percentile([r[1] for r in resampled], [2.5, 97.5], axis=0)
+
+    return first, total, first_ci, total_ci
+
+
+def run_mogp_sensitivity(results_dir, n_samples=2**20, chunk_size=2**14,
+                         processes=1, n_bootstrap=1000, seed=None):
+    """
+    computes Sobol indices of the emulator fitted by run_mogp_analysis and
+    saves them to results/sobol_indices.txt
+    """
+
+    emulator_file = join(results_dir, "results", "emulator.npz")
+    first, total, first_ci, total_ci = run_sensitivity(
+        emulator_file, load_design(results_dir), n_samples, chunk_size,
+        processes, n_bootstrap, seed)
+
+    print("input      first order               total")
+    for i, name in enumerate(INPUT_NAMES):
+        print("{:8s}  {:.4f} ({:.4f}, {:.4f})  {:.4f} ({:.4f}, {:.4f})".format(
+            name, first[i], first_ci[0, i], first_ci[1, i],
+            total[i], total_ci[0, i], total_ci[1, i]))
+
+    makedirs(join(results_dir, "results"), exist_ok=True)
+    np.savetxt(join(results_dir, "results", "sobol_indices.txt"),
+               np.column_stack((first, first_ci.T, total, total_ci.T)),
+               header=("rows " + " ".join(INPUT_NAMES) +
+                       "\nfirst first_low first_high total total_low total_high"))
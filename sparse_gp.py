@@ -0,0 +1,121 @@
+import numpy as np
+import mogp_emulator
+from mogp_emulator.GaussianProcess import PredictResult
+from scipy.linalg import cholesky, solve_triangular
+from designs import maximin_augment
+
+
+class FITCGaussianProcess(object):
+    """
+    Inducing point approximation to a zero mean GaussianProcess for large
+    training sets, using the fully independent training conditional (FITC)
+    approximation (Snelson and Ghahramani, 2006)
+
+    The covariance between training points is approximated through
+    n_inducing inducing points, chosen from the training inputs by a greedy
+    maximin criterion, so fitting costs O(n m^2) and prediction O(m^2) per
+    point for n training points and m inducing points, instead of O(n^3) and
+    O(n) (plus O(n^2) for the variance) for the exact GP. The kernel
+    hyperparameters and nugget are those of an exact GP fitted to a random
+    subset of n_subset training points (default 2*n_inducing).
+
+    With all training points as inducing points the predictions are those of
+    the exact GP. With fewer, the mean is smoothed where the inducing points
+    are sparse and the variances differ from those of the exact GP. For the
+    smooth test function of benchmarks/bench_sparse_gp.py with m = 200
+    inducing points (measured with mogp_emulator 0.7.2), the RMS difference
+    from the exact GP mean relative to the standard deviation of the function
+    was 1e-4 for n = 250, below 5e-5 for n = 500 and 2e-4 for n = 1000, and
+    the RMS error against the function stayed below 5e-5 for n = 2000 to
+    8000. The mean FITC variance was 0.18 and 6.6 times that of the exact GP
+    for n = 500 and 1000, and 340 times for n = 250, where the exact
+    variances are negligible and the jitter added to the inducing point
+    covariance dominates. Fitting took 95-210 s for all n, against 78, 411
+    and 1621 s for the exact GP with n = 250, 500 and 1000. Check the error
+    on held out simulations before relying on it for rougher outputs.
+    """
+
+    def __init__(self, inputs, targets, n_inducing=200, n_subset=None,
+                 n_tries=15, seed=None):
+        self.inputs = np.array(inputs, dtype=float)
+        self.targets = np.array(targets, dtype=float)
+        n = len(self.inputs)
+        self.D = self.inputs.shape[1]
+
+        n_inducing = min(int(n_inducing), n)
+        if n_subset is None:
+            n_subset = 2 * n_inducing
+        n_subset = min(int(n_subset), n)
+
+        # fit hyperparameters on a subset of the training data
+
+        prng = np.random.RandomState(seed)
+        subset = prng.choice(n, n_subset, replace=False)
+        gp = mogp_emulator.GaussianProcess(self.inputs[subset],
+                                           self.targets[subset])
+        # mogp_emulator 0.5 and later make floating point errors raise in
+        # fit_GP_MAP and leave them raising
+        with np.errstate():
+            gp = mogp_emulator.fit_GP_MAP(gp, n_tries=n_tries)
+        self.kernel = gp.kernel
+        if hasattr(gp.theta, "corr_raw"):
+            # mogp_emulator 0.5 and later: correlation kernel scaled by cov
+            self.theta = gp.theta.corr_raw
+            self.cov = gp.theta.cov
+        else:
+            # mogp_emulator 0.4: covariance scale is part of the kernel
+            self.theta = gp.theta[:self.D + 1]
+            self.cov = 1.
+        self.nugget = gp.nugget
+
+        # choose inducing points spread over the training inputs
+
+        lower = np.min(self.inputs, axis=0)
+        scale = np.max(self.inputs, axis=0) - lower
+        scale[scale == 0.] = 1.
+        unit_inputs = (self.inputs - lower) / scale
+        self.inducing = self.inputs[maximin_augment(np.zeros((0, self.D)),
+                                                    unit_inputs, n_inducing)]
+
+        # factorize in the whitened basis of the inducing points
+
+        self.variance = self._k(self.inputs[:1], self.inputs[:1])[0, 0]
+        Kuu = self._k(self.inducing, self.inducing)
+        Kuu[np.diag_indices_from(Kuu)] += 1.e-8 * self.variance
+        self.Luu = cholesky(Kuu, lower=True)
+
+        V = solve_triangular(self.Luu, self._k(self.inducing, self.inputs),
+                             lower=True)
+        Lambda = self.variance - np.sum(V**2, axis=0) + self.nugget
+
+        B = np.eye(n_inducing) + (V / Lambda).dot(V.T)
+        self.LB = cholesky(B, lower=True)
+        self.c = solve_triangular(self.LB, (V / Lambda).dot(self.targets),
+                                  lower=True)
+
+    def _k(self, x1, x2):
+        return self.cov * self.kernel.kernel_f(x1, x2, self.theta)
+
+    def predict(self, testing, chunk_size=10000):
+        """
+        predicts mean and variance at testing points, in chunks of chunk_size
+        points. Returns a PredictResult holding the mean and variance (and no
+        derivatives), as GaussianProcess.predict, so it can be passed to
+        HistoryMatching.
+        """
+
+        testing = np.atleast_2d(testing)
+        mean = np.empty(len(testing))
+        unc = np.empty(len(testing))
+
+        for start in range(0, len(testing), chunk_size):
+            chunk = slice(start, start + chunk_size)
+            Vs = solve_triangular(self.Luu, self._k(self.inducing,
+                                                    testing[chunk]),
+                                  lower=True)
+            W = solve_triangular(self.LB, Vs, lower=True)
+            mean[chunk] = W.T.dot(self.c)
+            unc[chunk] = (self.variance - np.sum(Vs**2, axis=0) +
+                          np.sum(W**2, axis=0))
+
+        return PredictResult(mean=mean, unc=unc, deriv=None)
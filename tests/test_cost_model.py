@@ -0,0 +1,34 @@
+import sys
+from os.path import dirname, abspath
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from cost_model import fit_cost_model, estimate_cost
+
+
+def _record(n_proc, wall_time, max_rss_mb, nt=100, nx=100, ny=50):
+    return {"name": "sim", "nt": nt, "nx": nx, "ny": ny, "n_proc": n_proc,
+            "wall_time": wall_time, "max_rss_mb": max_rss_mb}
+
+
+def test_single_configuration_scales_ideally():
+    model = fit_cost_model([_record(4, 10., 100.), _record(4, 12., 110.)])
+
+    assert model["assumed_scaling"] == ["work", "n_proc", "memory"]
+
+    base = estimate_cost(model, refine=1, n_proc=4, n_std=0.)
+    refined = estimate_cost(model, refine=2, n_proc=4, n_std=0.)
+    more_procs = estimate_cost(model, refine=1, n_proc=16, n_std=0.)
+
+    assert refined["wall_time"] > 7. * base["wall_time"]
+    assert more_procs["wall_time"] < base["wall_time"]
+    assert refined["memory_mb"] > 3. * base["memory_mb"]
+
+
+def test_varied_n_proc_is_fitted():
+    model = fit_cost_model([_record(1, 40., 400.), _record(2, 21., 210.),
+                            _record(4, 11., 110.)])
+
+    assert model["assumed_scaling"] == ["work"]
+    assert model["time_coefficients"][1] == 1.
+    assert -1.1 < model["time_coefficients"][2] < -0.8
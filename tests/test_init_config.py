@@ -0,0 +1,112 @@
+import sys
+import shutil
+from os import remove, makedirs
+from os.path import join, dirname, abspath, exists
+import numpy as np
+import pytest
+
+pytest.importorskip("mogp_emulator")
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from init_config import mogp_configuration_initialization, load_ensemble_design
+
+
+@pytest.mark.parametrize("design", ["lhs", "maximin", "sobol", "halton"])
+def test_sweep_design(tmp_path, design):
+    mogp_configuration_initialization(8, str(tmp_path), True, seed=1,
+                                      screen="none", design=design)
+
+    saved = np.load(join(str(tmp_path), "design.npy"))
+    assert saved.shape == (8, 3)
+    for i in range(8):
+        point = np.load(join(str(tmp_path), "SWEEP",
+                             "sample_point_{}".format(i + 1),
+                             "input_points.npy"))
+        assert np.array_equal(point, saved[i])
+
+
+def test_single_design(tmp_path):
+    mogp_configuration_initialization(1, str(tmp_path), False, seed=1,
+                                      screen="resample")
+
+    assert np.load(join(str(tmp_path), "input_points.npy")).shape == (1, 3)
+    assert not exists(join(str(tmp_path), "design.npy"))
+
+
+def test_augment_design(tmp_path):
+    mogp_configuration_initialization(4, str(tmp_path), True, seed=1,
+                                      screen="none")
+    existing = np.load(join(str(tmp_path), "design.npy"))
+
+    # a single job in between does not replace the ensemble design
+    mogp_configuration_initialization(1, str(tmp_path), False, seed=3,
+                                      screen="none")
+
+    mogp_configuration_initialization(3, str(tmp_path), True, seed=2,
+                                      screen="none", augment=True)
+
+    saved = np.load(join(str(tmp_path), "design.npy"))
+    assert saved.shape == (7, 3)
+    assert np.array_equal(saved[:4], existing)
+    assert exists(join(str(tmp_path), "SWEEP", "sample_point_7",
+                       "input_points.npy"))
+    assert not exists(join(str(tmp_path), "SWEEP", "sample_point_8"))
+
+
+def test_augment_without_design_file(tmp_path):
+    # an ensemble set up before design.npy was written
+    mogp_configuration_initialization(4, str(tmp_path), True, seed=1,
+                                      screen="none")
+    existing = np.load(join(str(tmp_path), "design.npy"))
+    remove(join(str(tmp_path), "design.npy"))
+    remove(join(str(tmp_path), "design_ed.pickle"))
+
+    mogp_configuration_initialization(2, str(tmp_path), True, seed=2,
+                                      screen="none", augment=True)
+
+    saved = np.load(join(str(tmp_path), "design.npy"))
+    assert saved.shape == (6, 3)
+    assert np.array_equal(saved[:4], existing)
+    assert exists(join(str(tmp_path), "SWEEP", "sample_point_6"))
+
+
+def test_augment_from_results(tmp_path):
+    config = join(str(tmp_path), "config")
+    makedirs(config)
+    mogp_configuration_initialization(4, config, True, seed=1, screen="none")
+    existing = np.load(join(config, "design.npy"))
+
+    # fetched results, with the points saved 2D by the simulations
+    for i in range(4):
+        run = join(str(tmp_path), "results", "RUNS",
+                   "sample_point_{}".format(i + 1))
+        shutil.copytree(join(config, "SWEEP",
+                             "sample_point_{}".format(i + 1)), run)
+        np.save(join(run, "input_points.npy"), np.array([existing[i]]))
+    shutil.rmtree(join(config, "SWEEP"))
+    remove(join(config, "design.npy"))
+    remove(join(config, "design_ed.pickle"))
+
+    ed, design, first = load_ensemble_design(
+        [join(str(tmp_path), "results")])
+    assert ed.get_n_parameters() == 3
+    assert first == 5
+    assert np.array_equal(design, existing)
+
+    mogp_configuration_initialization(3, config, True, seed=2, screen="none",
+                                      augment=True,
+                                      existing=(ed, design, first))
+
+    assert np.load(join(config, "design.npy")).shape == (7, 3)
+    assert exists(join(config, "SWEEP", "sample_point_7"))
+    assert not exists(join(config, "SWEEP", "sample_point_4"))
+
+
+def test_screen_skipped_for_other_boxes(tmp_path, capsys):
+    mogp_configuration_initialization(5, str(tmp_path), True, seed=1,
+                                      screen="resample",
+                                      bounds=[(-120., -80.), (0.1, 0.4)])
+
+    assert np.load(join(str(tmp_path), "design.npy")).shape == (5, 2)
+    assert "skipping the fault strength screen" in capsys.readouterr().out
@@ -1,4 +1,5 @@
 import numpy as np
+from functools import lru_cache
 
 def generate_profile(npoints, length, alpha, window, h = 1., seed=None):
     """
@@ -31,7 +32,7 @@ def generate_profile(npoints, length, alpha, window, h = 1., seed=None):
         nfreq = (npoints-1)//2+1
     amp[1:] = (alpha*(2.*np.pi/np.abs(k[1:]))**(0.5*(1.+2.*h))*np.sqrt(np.pi/length)/2.*float(npoints))
     amp[nflt+1:-nflt] = 0.
-    f = amp*np.exp(np.complex(0., 1.)*phase)
+    f = amp*np.exp(1j*phase)
     fund = np.fft.fft(prng.choice([-1., 1.])*alpha*length*np.sin(np.linspace(0., length, npoints)*np.pi/length))
     f = np.real(np.fft.ifft(f+fund))
     return f-f[0]-(f[-1]-f[0])/length*np.linspace(0., length, npoints)
@@ -121,6 +122,32 @@ def rotate_xy2nt_2d(sxx, sxy, syy, n, orientation=None):
     return sn, st
 
 
+def rotate_xy2nt_2d_array(sxx, sxy, syy, nx, ny, orientation=None):
+    """
+    Vectorized version of rotate_xy2nt_2d for many normal vectors at once
+    Inputs:
+    stress components sxx, sxy, syy (negative in compression)
+    nx, ny are the components of the (normalized) normal vectors
+    all inputs are broadcast against one another, so e.g. stresses of shape (m, 1) and normals
+    of shape (n,) give results of shape (m, n)
+    orientation (optional) is the tangent vector convention, as for rotate_xy2nt_2d
+    Returns:
+    normal and shear stress in rotated coordinates (array-like)
+    """
+    assert (orientation == "right" or orientation == "left" or
+            orientation == "x" or orientation == "y" or orientation == None)
+
+    if (orientation == "x" or orientation == "left"):
+        mx, my = -ny, nx
+    else:
+        mx, my = ny, -nx
+
+    sn = nx**2*sxx+2.*nx*ny*sxy+ny**2*syy
+    st = nx*mx*sxx+(mx*ny+nx*my)*sxy+ny*my*syy
+
+    return sn, st
+
+
 def tangent_2d(n, orientation=None):
     """
     Returns vector orthogonal to input vector n (must have length 2)
@@ -150,3 +177,78 @@ def tangent_2d(n, orientation=None):
         m[1] = -n[0]/np.sqrt(n[0]**2+n[1]**2)
 
     return m
+
+
+# fault dimensions and friction coefficient used by earthquake.create_problem
+
+LX = 32.
+LY = 12.
+MUS = 0.7
+
+
+def problem_size(refine=1, nt=None):
+    """
+    returns the number of time steps nt (800*refine+1 unless given), grid
+    points along the fault nx and grid points across each block ny
+    """
+
+    if nt is None:
+        nt = 800 * refine + 1
+
+    return nt, 400 * refine + 1, 150 * refine + 1
+
+
+@lru_cache()
+def fault_geometry(refine=1):
+    """
+    returns coordinates x, y and normal vector components norm_x, norm_y of
+    the rough fault surface for the given refinement
+
+    The geometry does not depend on the simulation inputs, so it is computed
+    once per refinement and cached (the returned arrays are read-only).
+    """
+
+    nt, nx, ny = problem_size(refine)
+
+    x = np.linspace(0., LX, nx)
+    y = LY * np.ones(nx) + generate_profile(nx, LX, 1.e-2, 20, 1., 18749)
+
+    norm_x, norm_y = generate_normals_2d(x, y, 'y')
+
+    for a in (x, y, norm_x, norm_y):
+        a.flags.writeable = False
+
+    return x, y, norm_x, norm_y
+
+
+def fault_tractions(points, refine=1):
+    """
+    computes normal and shear traction on the fault for an array of
+    simulation inputs (shape (npoints, 3), or a single point of length 3)
+
+    Returns sn, st with shape (npoints, nx)
+    """
+
+    points = np.atleast_2d(points)
+    assert points.shape[1] == 3
+
+    syy = points[:, 0:1]
+    ston = points[:, 1:2]
+    sxtosy = points[:, 2:3]
+
+    x, y, norm_x, norm_y = fault_geometry(refine)
+
+    return rotate_xy2nt_2d_array(sxtosy * syy, -syy * ston, syy,
+                                 norm_x, norm_y, 'y')
+
+
+def feasible_points(points, refine=1):
+    """
+    returns a boolean array indicating which simulation inputs give a shear
+    stress below the strength everywhere on the fault (the condition checked
+    in create_problem)
+    """
+
+    sn, st = fault_tractions(points, refine)
+
+    return np.all(st + MUS * sn < 0., axis=1)